@@ -20,6 +20,7 @@
 #
 # Prerequisites:
 # Install GtkTrayIcon (from the gtktrayicon/ subdirectory)
+# Keep tray_common.py and power_supplies.py in the same directory as this script
 # sudo apt-get install --no-install-recommends libgirepository1.0-dev gobject-introspection \
 #  gir1.2-gtk-3.0 python3-pydbus upower
 #
@@ -38,18 +39,216 @@ background_color = '#9A9A9A'
 
 import gi
 gi.require_version('Gtkti', '3.0')
-from gi.repository import Gtkti, Gtk, Gdk, GLib
-import signal, sys, os
-import threading
-from pydbus import SystemBus
+from gi.repository import Gtkti, Gtk, Gdk, GLib, Gio
+import tray_common
+import power_supplies
+import sys
+import socket
+import array, math, time
 
 # For troubleshooting purposes, `upower --dump` should print the same data as DBus Properties, and
 # `dbus-monitor --system` should show the DBus Signals.
 
 # UPower polls the system at relatively infrequent intervals.  (Dynamic intervals, typically around
-# 2 minutes.)  If updates are needed more frequently than that, try calling battery.Refresh()
-# periodically.  If that doesn't help, or you can parse the output of `acpi -b` instead of using
-# UPower via DBus.
+# 2 minutes.)  If updates are needed more frequently than that, use the 'sysfs' backend (see
+# `backend` below), which reads /sys/class/power_supply/ directly whenever the kernel reports a
+# change.
+
+UPOWER_NAME = 'org.freedesktop.UPower'
+UPOWER_PATH = '/org/freedesktop/UPower'
+UPOWER_IFACE = 'org.freedesktop.UPower'
+UPOWER_DEVICE_IFACE = 'org.freedesktop.UPower.Device'
+PROPERTIES_IFACE = 'org.freedesktop.DBus.Properties'
+
+# UPower device types (See https://upower.freedesktop.org/docs/Device.html)
+UPOWER_TYPE_BATTERY = 2
+UPOWER_PERIPHERAL_TYPES = {
+  5: 'Mouse', 6: 'Keyboard', 7: 'PDA', 8: 'Phone', 9: 'Media Player', 10: 'Tablet',
+  12: 'Gaming Input', 13: 'Pen', 14: 'Touchpad', 17: 'Headset', 18: 'Speakers', 19: 'Headphones',
+  22: 'Remote Control', 26: 'Wearable', 27: 'Toy', 28: 'Bluetooth Device',
+}
+
+# Local mirror of the properties of a UPower device
+# The mirror is seeded with a single GetAll call when the device is added, then kept up to date
+# using the values included in the device's PropertiesChanged signals, so reading properties
+# (`device.props`) never requires a D-Bus round trip.
+class UPowerDevice:
+
+  def __init__(self, app, path, props):
+    self.app = app
+    self.path = path
+    self.props = props
+
+  def is_battery(self):
+    return self.props.get('Type') == UPOWER_TYPE_BATTERY
+
+  def is_peripheral(self):
+    return self.props.get('Type') in UPOWER_PERIPHERAL_TYPES
+
+  def properties_changed(self, changed, invalidated):
+    self.props.update(changed)
+    # UPower always includes the new values, but the D-Bus spec allows them to be omitted.  The
+    # invalidated values are fetched asynchronously, so a slow UPower never blocks the main loop.
+    if invalidated:
+      self.app.fetch_device_properties(self)
+
+# Power supplies read directly from sysfs (See /sys/class/power_supply/*/uevent and
+# power_supplies.py)
+# The kernel sends a uevent (received here via a netlink socket watched by the GLib main loop)
+# whenever a power supply is added or removed, whenever the charger is plugged or unplugged, and
+# (for most batteries) whenever the charge level changes, so changes are usually shown within a
+# fraction of a second without polling.  Some batteries don't send uevents for charge level
+# changes, so the power supplies are also re-read every `poll_interval` seconds.
+# `root` may be changed to the path of a fake sysfs tree for testing.  (uevents from the real kernel
+# still cause the fake tree to be re-read, and `poll_interval` controls how quickly other changes to
+# the fake tree are noticed.)
+NETLINK_KOBJECT_UEVENT = 15
+class SysfsPowerSupplies:
+
+  def __init__(self, app, root, poll_interval):
+    self.app = app
+    self.root = root
+    self.scan_pending = False
+    self.uevents = 0
+    self.scans = 0
+    tray_common.register_stats('BatteryApp.sysfs', lambda self=self: {
+      'uevents': self.uevents,
+      'scans': self.scans,
+    })
+    try:
+      self.socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM | socket.SOCK_NONBLOCK,
+       NETLINK_KOBJECT_UEVENT)
+      self.socket.bind((0, 1))  # Kernel uevent multicast group
+      tray_common.watch_fd(self.socket.fileno(), GLib.IOCondition.IN, self.uevent)
+    except OSError as e:
+      print('Unable to receive power supply uevents: '+str(e), file=sys.stderr)
+    if poll_interval:
+      GLib.timeout_add_seconds(poll_interval, self.poll)
+    self.scan()
+
+  def uevent(self, fd, condition):
+    # Drain the socket, since a single change (such as plugging in the charger) often causes
+    # several uevents
+    while True:
+      try:
+        message = self.socket.recv(8192)
+      except BlockingIOError:
+        break
+      except OSError as e:
+        # ENOBUFS indicates that uevents were dropped, so one of them may have been relevant
+        print('Error receiving uevents: '+str(e), file=sys.stderr)
+        self.request_scan()
+        continue
+      if b'\0SUBSYSTEM=power_supply\0' in message:
+        self.uevents += 1
+        self.request_scan()
+    # Return true to keep this method registered as a GLib fd handler
+    return True
+
+  def poll(self):
+    self.request_scan()
+    # Return true to keep this method registered as a GLib timeout handler
+    return True
+
+  def request_scan(self):
+    if not self.scan_pending:
+      self.scan_pending = True
+      GLib.idle_add(self.scan)
+
+  def scan(self):
+    self.scan_pending = False
+    self.scans += 1
+    try:
+      supplies = power_supplies.read_power_supplies(self.root)
+    except OSError as e:
+      print('Unable to read '+self.root+': '+str(e), file=sys.stderr)
+      supplies = {}
+    self.app.upower_devices = dict((path, UPowerDevice(self.app, path, props))
+     for path, props in supplies.items())
+    self.app.index_changed()
+
+    # Return false to unregister this method as a GLib idle handler
+    return False
+
+UPOWER_CHARGING_STATES = (1, 5)  # Charging, Pending Charge
+UPOWER_DISCHARGING_STATES = (2, 3, 6)  # Discharging, Empty, Pending Discharge
+
+SPARKLINE_CHARS = '\u2581\u2582\u2583\u2584\u2585\u2586\u2587\u2588'
+
+def format_duration(seconds):
+  m, s = divmod(int(seconds), 60)
+  h, m = divmod(m, 60)
+  return '%dh %02dm %02ds' % (h, m, s)
+
+# History of (timestamp, percentage) samples for one battery, and an estimate of the remaining
+# charge/discharge time based on it.
+# UPower's TimeToEmpty and TimeToFull are based on the instantaneous energy rate, so they are often
+# 0 or wildly wrong for a while after the charger is plugged or unplugged.  Instead, this estimates
+# the remaining time from an exponentially weighted moving average of the rate of change of the
+# percentage, with a time constant of `time_constant` seconds.  The average is reset whenever the
+# state changes, and the interval in which the state changed is not used (since the percentage
+# change at the end of that interval may have started before the state changed).
+# The samples are kept in preallocated arrays that are used as a ring buffer, so memory use does
+# not grow with uptime, and each sample updates the estimate in constant time.
+# Timestamps should be taken from CLOCK_BOOTTIME (which, unlike CLOCK_MONOTONIC, includes time spent
+# suspended), so that the charge used while suspended is not attributed to the time spent awake.
+class BatteryHistory:
+
+  def __init__(self, size, time_constant):
+    self.size = size
+    self.time_constant = time_constant
+    self.timestamps = array.array('d', bytes(8 * size))
+    self.percentages = array.array('d', bytes(8 * size))
+    self.count = 0  # Total number of samples added
+    self.state = None
+    self.state_samples = 0  # Number of samples added since the state changed
+    self.slope = None  # Smoothed rate of change of the percentage, in percent per second
+
+  # A sample is only added if the percentage or state has changed since the previous sample
+  def add(self, timestamp, percentage, state):
+    if self.count:
+      last = (self.count - 1) % self.size
+      last_timestamp = self.timestamps[last]
+      last_percentage = self.percentages[last]
+      if state == self.state and percentage == last_percentage:
+        return
+    if state != self.state:
+      self.state = state
+      self.state_samples = 0
+      self.slope = None
+    elif self.state_samples >= 1 and timestamp > last_timestamp:
+      dt = timestamp - last_timestamp
+      slope = (percentage - last_percentage) / dt
+      if self.slope is None:
+        self.slope = slope
+      else:
+        self.slope += (1 - math.exp(-dt / self.time_constant)) * (slope - self.slope)
+    self.state_samples += 1
+    i = self.count % self.size
+    self.timestamps[i] = timestamp
+    self.percentages[i] = percentage
+    self.count += 1
+
+  # Estimated time (in seconds) until the battery is empty (if discharging) or full (if charging),
+  # or None if there is not enough history yet
+  def remaining(self):
+    if self.slope is None:
+      return None
+    percentage = self.percentages[(self.count - 1) % self.size]
+    if self.state in UPOWER_DISCHARGING_STATES and self.slope < 0:
+      return percentage / -self.slope
+    if self.state in UPOWER_CHARGING_STATES and self.slope > 0:
+      return (100 - percentage) / self.slope
+    return None
+
+  # Returns a bar chart of the last `width` percentages (oldest first)
+  def sparkline(self, width):
+    n = min(self.count, self.size, width)
+    chars = []
+    for j in range(self.count - n, self.count):
+      percentage = self.percentages[j % self.size]
+      chars.append(SPARKLINE_CHARS[min(7, max(0, int(percentage * 8 / 100)))])
+    return ''.join(chars)
 
 # WARNING: Variable scope for Python inline functions and lambdas does not work like other
 # languages!  To ensure that definition-scope variables are passed into the function/lambda's scope
@@ -58,45 +257,132 @@ from pydbus import SystemBus
 
 class BatteryApp:
 
-  def __init__(self):
+  # `dbus` may be an existing pydbus SystemBus() connection (by default, the connection returned
+  # by tray_common.get_system_bus() is used)
+  def __init__(self, dbus=None):
     self.prefix = 'B:'
     self.separator = '/'
     self.suffix = ' '
     self.tooltip_heading = 'Battery Status:\n'
 
     self.low_battery_alarm_threshold = 5
+
+    # 'upower' to get batteries from UPower via DBus, or 'sysfs' to read them directly from
+    # /sys/class/power_supply/ (See SysfsPowerSupplies)
+    self.backend = 'upower'
+    #self.backend = 'sysfs'
+    self.sysfs_root = '/sys/class/power_supply'
+    self.sysfs_poll_interval = 60  # seconds
+
+    # UPower only re-reads the batteries every couple of minutes, so the low battery alarm could be
+    # shown too late.  While discharging within `refresh_margin` percent of the alarm threshold,
+    # ask UPower to re-read the discharging batteries (using Refresh()) every `refresh_max_interval`
+    # seconds at the edge of the margin, decreasing linearly to every `refresh_min_interval` seconds
+    # at the threshold.  No extra calls are made while charging or above the margin.  (The 'sysfs'
+    # backend doesn't need this.)  Each call is logged to stderr.
+    self.refresh_margin = 10  # percent
+    self.refresh_min_interval = 10  # seconds
+    self.refresh_max_interval = 60  # seconds
+    self.refresh_interval = None
+    self.refresh_timer = None
+    self.refresh_calls = 0
+
+    # Per-battery history, used to estimate the remaining time (See BatteryHistory)
+    self.history_size = 256  # samples
+    self.history_time_constant = 600  # seconds
+    self.sparkline_width = 24  # Number of samples to show in the tooltip, or 0 to hide it
+    self.battery_history = {}  # BatteryHistory objects, keyed by device path
+
+    # Also show the batteries of peripherals (such as wireless mice, keyboards, and headsets) in the
+    # tooltip.  This can also be toggled from the menu.
+    self.show_peripherals = False
     self.low_battery_alarm_visible = False
 
+    # UPower often sends several PropertiesChanged signals in quick succession.  Wait for them to
+    # settle (up to the max latency) before updating the UI.  (See tray_common.UpdateDispatcher)
+    self.update_min_interval = 0.1  # seconds
+    self.update_max_latency = 0.5  # seconds
+    self.dispatcher = tray_common.UpdateDispatcher('BatteryApp', self.gtk_update_ui,
+     self.update_min_interval, self.update_max_latency)
+
     self.build_ui()
 
-    self.dbus = SystemBus()
-    self.upower = self.dbus.get('.UPower', '/org/freedesktop/UPower')
-    self.battery_subscriptions = []
-    self.upower.DeviceAdded.connect(lambda name, vals, a: self.get_upower_batteries())
-    self.upower.DeviceRemoved.connect(lambda name, vals, a: self.get_upower_batteries())
-    self.get_upower_batteries()
-    self.start_signal_thread()
+    # For troubleshooting and performance monitoring (See tray_common.register_stats)
+    self.dbus_calls = 0
+    self.dbus_signals = 0
+    self.dbus_subscriptions = []
+    tray_common.register_stats('BatteryApp.dbus', lambda self=self: {
+      'calls': self.dbus_calls,
+      'signals': self.dbus_signals,
+      'subscriptions': len(self.dbus_subscriptions),
+      'devices': len(self.upower_devices),
+      'refresh_calls': self.refresh_calls,
+      'refresh_interval': self.refresh_interval,
+    })
+
+    self.dbus = dbus
+    # UPower devices, keyed by object path
+    # Devices are added and removed individually as UPower reports them, so a device that comes and
+    # goes (such as a Bluetooth mouse) doesn't cause every other device to be re-fetched.
+    self.upower_devices = {}
+    self.upower_batteries = []
+    self.upower_peripherals = []
+    tray_common.mark_startup('BatteryApp', 'ui_built')
+    # Connecting to the system bus can be slow at login, so show the placeholder label first
+    if self.backend == 'sysfs':
+      self.renderer.after_first_paint(self.connect_sysfs)
+    else:
+      self.renderer.after_first_paint(self.connect_upower)
+
+  def connect_sysfs(self):
+    self.sysfs = SysfsPowerSupplies(self, self.sysfs_root, self.sysfs_poll_interval)
+    tray_common.mark_startup('BatteryApp', 'backend_connected')
+
+  def connect_upower(self):
+    if not self.dbus:
+      self.dbus = tray_common.get_system_bus()
+    # Subscribe to the signals directly rather than through a pydbus proxy, since creating a proxy
+    # requires an Introspect round trip
+    self.dbus_subscriptions += [
+      self.dbus.subscribe(sender=UPOWER_NAME, iface=UPOWER_IFACE, signal='DeviceAdded',
+       object=UPOWER_PATH,
+       signal_fired=lambda sender, path, iface, signal, params: self.device_added(*params)),
+      self.dbus.subscribe(sender=UPOWER_NAME, iface=UPOWER_IFACE, signal='DeviceRemoved',
+       object=UPOWER_PATH,
+       signal_fired=lambda sender, path, iface, signal, params: self.device_removed(*params)),
+      # One subscription covers the PropertiesChanged signals of every UPower device
+      self.dbus.subscribe(sender=UPOWER_NAME, iface=PROPERTIES_IFACE, signal='PropertiesChanged',
+       signal_fired=self.device_properties_changed),
+    ]
+    self.call_async(UPOWER_PATH, UPOWER_IFACE, 'EnumerateDevices', None, '(ao)',
+     self.got_upower_devices)
+    tray_common.mark_startup('BatteryApp', 'backend_connected')
 
   def build_ui(self):
     self.tray = tray = Gtkti.TrayIcon()
     self.eventbox = eventbox = Gtk.EventBox()
     if background_color:
-      css = Gtk.CssProvider()
-      css.load_from_data(('* { background-color: '+background_color+'; }').encode())
-      Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+      tray_common.set_background_color(background_color)
     eventbox.set_tooltip_text(self.tooltip_heading+'Unknown')
     tray.add(eventbox)
     self.tray_label = tray_label = Gtk.Label(label=self.prefix+'?'+self.suffix)
     eventbox.add(tray_label)
     tray.show_all()
+    self.renderer = tray_common.Renderer('BatteryApp', tray_label, eventbox)
 
     menu = Gtk.Menu()
+    # The sysfs backend does not report peripherals
+    if self.backend != 'sysfs':
+      item_show_peripherals = Gtk.CheckMenuItem(label='Show Peripherals')
+      item_show_peripherals.set_active(self.show_peripherals)
+      def toggle_peripherals(item_show_peripherals, self=self):
+        self.show_peripherals = item_show_peripherals.get_active()
+        self.update_ui()
+      item_show_peripherals.connect('toggled', toggle_peripherals)
+      menu.append(item_show_peripherals)
     item_quit = Gtk.MenuItem(label='Quit')
     def quit(menu_item):
-      if sys.version_info < (3, 0):
-        os.kill(os.getpid(), signal.SIGINT)
-      else:
-        Gtk.main_quit()
+      Gtk.main_quit()
     item_quit.connect('activate', quit)
     menu.append(item_quit)
     menu.show_all()
@@ -107,7 +393,7 @@ class BatteryApp:
 
   # Update the UI (thread-safe)
   def update_ui(self):
-    GLib.idle_add(self.gtk_update_ui)
+    self.dispatcher.request()
 
   # Update the UI (within the GTK main thread ; not thread-safe)
   def gtk_update_ui(self):
@@ -115,36 +401,50 @@ class BatteryApp:
     tooltip_str = ''
     max_percentage = 0
     for battery in self.upower_batteries:
+      props = battery.props
+      percentage = props['Percentage']
       if display_str:
         display_str += '/'
         tooltip_str += '\n'
-      tooltip_str += battery.NativePath+': '
-      state = battery.State
+      tooltip_str += props['NativePath']+': '
+      state = props['State']
       if state == 1 or state == 5:
-        tooltip_str += 'Charging ('+str(battery.Percentage)+'%)'
-        display_str += str(int(battery.Percentage))+'+'
+        tooltip_str += 'Charging ('+str(percentage)+'%)'
+        display_str += str(int(percentage))+'+'
       elif state == 2 or state == 3 or state == 6:
-        tooltip_str += 'Discharging ('+str(battery.Percentage)+'%)'
-        display_str += str(int(battery.Percentage))+'-'
+        tooltip_str += 'Discharging ('+str(percentage)+'%)'
+        display_str += str(int(percentage))+'-'
       elif state == 4:
-        tooltip_str += 'Full ('+str(battery.Percentage)+'%)'
-        display_str += str(int(battery.Percentage))
+        tooltip_str += 'Full ('+str(percentage)+'%)'
+        display_str += str(int(percentage))
       else:
-        tooltip_str += 'Unknown ('+str(battery.Percentage)+'%)'
+        tooltip_str += 'Unknown ('+str(percentage)+'%)'
         display_str += '?'
-      if battery.TimeToFull:
-        m, s = divmod(battery.TimeToFull, 60)
-        h, m = divmod(m, 60)
-        tooltip_str += ', Remaining Charge Time: '+('%dh %02dm %02ds' % (h, m, s))
-      if battery.TimeToEmpty:
-        m, s = divmod(battery.TimeToEmpty, 60)
-        h, m = divmod(m, 60)
-        tooltip_str += ', Remaining Discharge Time: '+('%dh %02dm %02ds' % (h, m, s))
-      if battery.Percentage > max_percentage:
-        max_percentage = battery.Percentage
-    self.tray_label.set_text(self.prefix+display_str+self.suffix)
-    self.eventbox.set_tooltip_text(self.tooltip_heading+tooltip_str)
-    if max_percentage < self.low_battery_alarm_threshold and not self.low_battery_alarm_visible:
+      if props['TimeToFull']:
+        tooltip_str += ', Remaining Charge Time: '+format_duration(props['TimeToFull'])
+      if props['TimeToEmpty']:
+        tooltip_str += ', Remaining Discharge Time: '+format_duration(props['TimeToEmpty'])
+      history = self.battery_history.get(battery.path)
+      remaining = history.remaining() if history else None
+      if remaining is not None:
+        tooltip_str += ', Estimated Remaining Time: '+format_duration(remaining)
+      if self.sparkline_width and history and history.count > 1:
+        tooltip_str += '\n  '+history.sparkline(self.sparkline_width)
+      if percentage > max_percentage:
+        max_percentage = percentage
+    if self.show_peripherals:
+      for device in self.upower_peripherals:
+        props = device.props
+        if tooltip_str:
+          tooltip_str += '\n'
+        tooltip_str += props.get('Model') or props.get('NativePath')
+        tooltip_str += ' ('+UPOWER_PERIPHERAL_TYPES[props['Type']]+'): '
+        tooltip_str += str(props['Percentage'])+'%'
+    self.renderer.render(self.prefix+display_str+self.suffix, self.tooltip_heading+tooltip_str)
+    # Until the batteries have been enumerated (and on systems without a battery), max_percentage is
+    # meaningless
+    if self.upower_batteries and max_percentage < self.low_battery_alarm_threshold and \
+       not self.low_battery_alarm_visible:
       self.low_battery_alarm_visible = True
       dialog = Gtk.Dialog()
       dialog.set_title('Warning')
@@ -157,43 +457,143 @@ class BatteryApp:
         dialog.destroy()
       dialog.connect('response', close_pressed)
       dialog.show_all()
+    if self.backend == 'upower':
+      self.schedule_refresh(max_percentage)
 
     # Return false to unregister this method as a GLib idle handler
     return False
 
-  def get_upower_batteries(self):
-    paths = self.upower.EnumerateDevices()
-    devices = list(map(lambda p: self.dbus.get('.UPower', p), paths))
-    batteries = list(filter(lambda d: d.Type == 2, devices))
-    for s in self.battery_subscriptions:
-      s.disconnect()
-    self.battery_subscriptions = []
-    for battery in batteries:
-      s = battery.PropertiesChanged.connect(lambda name, vals, a: self.update_ui())
-      self.battery_subscriptions.append(s)
-    self.upower_batteries = batteries
+  # Returns the interval (in seconds) at which the batteries should be refreshed, or None
+  def get_refresh_interval(self, max_percentage):
+    states = [battery.props.get('State') for battery in self.upower_batteries]
+    if not any(state in UPOWER_DISCHARGING_STATES for state in states) or \
+       any(state in UPOWER_CHARGING_STATES for state in states):
+      return None
+    # The alarm is shown when the fullest battery drops below the threshold
+    distance = max(0, max_percentage - self.low_battery_alarm_threshold)
+    if distance > self.refresh_margin:
+      return None
+    return int(self.refresh_min_interval +
+     (self.refresh_max_interval - self.refresh_min_interval) * distance / self.refresh_margin)
+
+  def schedule_refresh(self, max_percentage):
+    interval = self.get_refresh_interval(max_percentage)
+    if interval == self.refresh_interval:
+      return
+    if self.refresh_timer:
+      GLib.source_remove(self.refresh_timer)
+      self.refresh_timer = None
+    if interval is None:
+      self.log_refresh('Refresh schedule: Stopped')
+    else:
+      self.log_refresh('Refresh schedule: Every '+str(interval)+' seconds ('+str(max_percentage)+
+       '% remaining)')
+      self.refresh_timer = GLib.timeout_add_seconds(interval, self.refresh_batteries)
+    self.refresh_interval = interval
+
+  def refresh_batteries(self):
+    for battery in self.upower_batteries:
+      if battery.props.get('State') in UPOWER_DISCHARGING_STATES:
+        self.refresh_calls += 1
+        self.log_refresh('Refreshing '+battery.props.get('NativePath', battery.path)+' ('+
+         str(battery.props.get('Percentage'))+'%, call '+str(self.refresh_calls)+')')
+        # Any changes are reported by the device's PropertiesChanged signal
+        self.call_async(battery.path, UPOWER_DEVICE_IFACE, 'Refresh', None, '()', lambda: None)
+    # Return true to keep this method registered as a GLib timeout handler
+    return True
+
+  def log_refresh(self, message):
+    print(time.strftime('%Y-%m-%d %H:%M:%S')+' BatteryApp: '+message, file=sys.stderr)
+
+  # Asynchronously call a UPower method, then call `callback(*return_values)`
+  # Errors are expected if a device is removed while a call is in progress.  In that case, the
+  # callback is not called.
+  def call_async(self, path, iface, method, args, reply_type, callback):
+    def call_done(con, result, callback=callback):
+      try:
+        reply = con.call_finish(result).unpack()
+      except GLib.Error as e:
+        print('Error from UPower: '+e.message, file=sys.stderr)
+        return
+      callback(*reply)
+    self.dbus.con.call(UPOWER_NAME, path, iface, method, args, GLib.VariantType.new(reply_type),
+     Gio.DBusCallFlags.NONE, -1, None, call_done)
+    self.dbus_calls += 1
+
+  def fetch_device_properties(self, device):
+    def got_properties(props, self=self, device=device):
+      # Ignore the reply if the device was removed while the call was in progress
+      if self.upower_devices.get(device.path) is device:
+        device.props.update(props)
+        self.device_changed(device)
+    self.call_async(device.path, PROPERTIES_IFACE, 'GetAll',
+     GLib.Variant('(s)', (UPOWER_DEVICE_IFACE,)), '(a{sv})', got_properties)
+
+  def got_upower_devices(self, paths):
+    tray_common.mark_startup('BatteryApp', 'devices_enumerated')
+    for path in paths:
+      self.add_device(path)
+    if not paths:
+      self.index_changed()
+
+  def device_added(self, path):
+    self.dbus_signals += 1
+    self.add_device(path)
+
+  def add_device(self, path):
+    if path in self.upower_devices:
+      return
+    def got_properties(props, self=self, path=path):
+      if path not in self.upower_devices:
+        self.upower_devices[path] = UPowerDevice(self, path, props)
+        self.index_changed()
+    self.call_async(path, PROPERTIES_IFACE, 'GetAll', GLib.Variant('(s)', (UPOWER_DEVICE_IFACE,)),
+     '(a{sv})', got_properties)
+
+  def device_removed(self, path):
+    self.dbus_signals += 1
+    if self.upower_devices.pop(path, None):
+      self.index_changed()
+
+  def index_changed(self):
+    devices = self.upower_devices.values()
+    self.upower_batteries = [d for d in devices if d.is_battery()]
+    self.upower_peripherals = [d for d in devices if d.is_peripheral()]
+    for path in list(self.battery_history):
+      if path not in self.upower_devices:
+        del self.battery_history[path]
+    # UPower batteries are indexed by GetAll replies, and sysfs batteries by every uevent or poll
+    for battery in self.upower_batteries:
+      self.record_history(battery)
     self.update_ui()
 
-  def start_signal_thread(self):
-    thread = threading.Thread(target=GLib.MainLoop().run)
-    thread.daemon = True
-    thread.start()
+  # Add a sample to a battery's history (See BatteryHistory)
+  # Samples are recorded when the battery's properties change, not when the UI is updated, so that
+  # the history does not depend on how often (or whether) the UI is rendered.
+  def record_history(self, battery):
+    history = self.battery_history.get(battery.path)
+    if not history:
+      history = self.battery_history[battery.path] = \
+       BatteryHistory(self.history_size, self.history_time_constant)
+    history.add(time.clock_gettime(time.CLOCK_BOOTTIME), battery.props['Percentage'],
+     battery.props['State'])
+
+  def device_properties_changed(self, sender, path, iface, signal, params):
+    self.dbus_signals += 1
+    device = self.upower_devices.get(path)
+    if not device or params[0] != UPOWER_DEVICE_IFACE:
+      return
+    device.properties_changed(params[1], params[2])
+    self.device_changed(device)
+
+  def device_changed(self, device):
+    if device.is_battery():
+      self.record_history(device)
+      self.update_ui()
+    elif self.show_peripherals and device.is_peripheral():
+      self.update_ui()
 
 if __name__ == '__main__':
   BatteryApp()
 
-  def on_sigint(_signum, _frame):
-    Gtk.main_quit()
-  signal.signal(signal.SIGINT, on_sigint)
-
-  # If the main thread is running C code (such as Gtk.main()), then Python signal handlers will not
-  # run until that C code returns.  To work around this, run the C code in a separate thread, then
-  # sleep the main thread.  Unfortunately, threading.Thread().join() and threading.Event().wait() in
-  # Python 2.X (but not 3.X) also block signal handlers (see http://bugs.python.org/issue1167930).
-  # To work around this, sleep the main thread using signal.pause(), and wake it from the 'Quit'
-  # menu item above using `os.kill(os.getpid(), signal.SIGINT)`.
-  thread = threading.Thread(target=Gtk.main)
-  thread.start()
-  if sys.version_info < (3, 0):
-    signal.pause()
-  thread.join()
+  tray_common.run()
@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+
+#
+# Copyright 2026 Paul Donohue <Tray_Apps@PaulSD.com>
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.  If
+# not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Headless benchmark for the Python tray apps in this directory.
+#
+# Each app is run in its own process under a virtual X server with a stand-in tray manager, and is
+# driven by fake backends:  A private dbus-daemon (used as the apps' system bus) exports fake UPower
+# and wpa_supplicant objects, and VolumeApp's ALSA mixer is replaced by a fake mixer that is driven
+# through a named pipe.  For each app, this reports:
+#   startup_s: Time from process start to the first paint of the tray icon
+#   rss_kb: Resident memory after startup
+#   idle_wakeups_per_s: Context switches per second while no events are being sent
+#   latency_ms: Percentiles of the time from a backend event to the resulting label change, with
+#    events spaced `--interval` apart (for TimeApp, the time from the second boundary to the label
+#    change)
+#   events_per_s: Rate at which a burst of `--events` backend events is handled (from the first
+#    event until the label shows the result of the last event)
+#   slider_writes_per_drag: For VolumeApp, the number of mixer writes made by a simulated drag of
+#    the popup slider, with and without throttling (See simulate_drags())
+#   stats: The app's own statistics (See tray_common.register_stats)
+# Results are written as JSON to `--output` so that they can be compared between revisions.
+#
+# Usage: benchmark.py [--output FILE] [--events N] [--interval SECONDS] [--idle SECONDS]
+#  [--tray-manager COMMAND] [app ...]
+# Apps are `time`, `battery`, `volume`, and `wlan`.  All of them are run by default.
+#
+# Prerequisites:
+# Install the prerequisites of each app (see the comments at the top of each app's script)
+# sudo apt-get install --no-install-recommends xvfb stalonetray dbus
+# Keep this script in the same directory as the app scripts
+#
+
+import sys, os
+import argparse
+import json
+import re
+import select
+import subprocess
+import tempfile
+import time
+
+# Apps that can be benchmarked: name -> (module, class, fake D-Bus service, label value regex)
+apps = {
+  'time': ('time_app', 'TimeApp', None, None),
+  'battery': ('battery_app', 'BatteryApp', 'upower', r'B:(\d+)'),
+  'volume': ('volume_app', 'VolumeApp', None, r'V:(\d+)'),
+  'wlan': ('wlan_app', 'WlanApp', 'wpa_supplicant', r'(\d+)%'),
+}
+
+# Time allowed for each process to start or respond
+timeout = 30  # seconds
+
+# Values sent by the fake backends, chosen so that consecutive values always differ, every value is
+# shown in the label, and no value triggers BatteryApp's low battery alarm
+def event_value(i):
+  return 10 + (i * 2) % 80
+
+def percentile(values, p):
+  if not values:
+    return None
+  values = sorted(values)
+  return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+
+#
+# Fake backends
+#
+
+# Emit events by calling `emit(value)`, then print the emission times as a JSON line.
+# Runs within a GLib main loop, in response to a command read from stdin:
+#   latency <n> <interval> : Emit n events, spaced `interval` seconds apart
+#   burst <n> : Emit n events as fast as possible
+def run_fake_commands(emit):
+  from gi.repository import GLib
+  def run_command(fd, condition, emit=emit):
+    line = sys.stdin.readline()
+    if not line:
+      sys.exit(0)
+    command = line.split()
+    n = int(command[1])
+    emitted = []
+    def done():
+      print(json.dumps(emitted), flush=True)
+    if command[0] == 'latency':
+      interval = float(command[2])
+      def emit_next(emitted=emitted):
+        v = event_value(len(emitted))
+        emitted.append((time.monotonic(), v))
+        emit(v)
+        if len(emitted) < n:
+          return True
+        # Give the app time to handle the last event before reporting
+        GLib.timeout_add(int(interval*1000), lambda: done() and False)
+        return False
+      GLib.timeout_add(int(interval*1000), emit_next)
+    else:
+      for i in range(n):
+        v = event_value(i)
+        emitted.append((time.monotonic(), v))
+        emit(v)
+      GLib.idle_add(lambda: done() and False)
+    return True
+  GLib.unix_fd_add_full(GLib.PRIORITY_DEFAULT, sys.stdin.fileno(), GLib.IOCondition.IN,
+   run_command)
+
+def run_fake(name):
+  from gi.repository import GLib
+  from pydbus import SystemBus
+  from pydbus.generic import signal
+
+  if name == 'upower':
+    class FakeUPower:
+      dbus = '''
+        <node>
+          <interface name="org.freedesktop.UPower">
+            <method name="EnumerateDevices"><arg type="ao" direction="out"/></method>
+            <signal name="DeviceAdded"><arg type="o"/></signal>
+            <signal name="DeviceRemoved"><arg type="o"/></signal>
+          </interface>
+        </node>
+      '''
+      DeviceAdded = signal()
+      DeviceRemoved = signal()
+      def EnumerateDevices(self):
+        return ['/org/freedesktop/UPower/devices/battery_BAT0']
+
+    class FakeUPowerDevice:
+      dbus = '''
+        <node>
+          <interface name="org.freedesktop.UPower.Device">
+            <method name="Refresh"/>
+            <property name="NativePath" type="s" access="read"/>
+            <property name="Model" type="s" access="read"/>
+            <property name="Type" type="u" access="read"/>
+            <property name="PowerSupply" type="b" access="read"/>
+            <property name="State" type="u" access="read"/>
+            <property name="Percentage" type="d" access="read"/>
+            <property name="Energy" type="d" access="read"/>
+            <property name="EnergyFull" type="d" access="read"/>
+            <property name="EnergyRate" type="d" access="read"/>
+            <property name="TimeToEmpty" type="x" access="read"/>
+            <property name="TimeToFull" type="x" access="read"/>
+          </interface>
+        </node>
+      '''
+      PropertiesChanged = signal()
+      def __init__(self):
+        self.NativePath = 'BAT0'
+        self.Model = 'Fake Battery'
+        self.Type = 2
+        self.PowerSupply = True
+        self.State = 2  # Discharging
+        self.Percentage = 50.0
+        self.Energy = 25.0
+        self.EnergyFull = 50.0
+        self.EnergyRate = 10.0
+        self.TimeToEmpty = 9000
+        self.TimeToFull = 0
+      def Refresh(self):
+        pass
+
+    device = FakeUPowerDevice()
+    def emit(v, device=device):
+      device.Percentage = float(v)
+      device.Energy = device.EnergyFull * v / 100.0
+      device.PropertiesChanged('org.freedesktop.UPower.Device',
+       {'Percentage': device.Percentage, 'Energy': device.Energy}, [])
+    bus = SystemBus()
+    bus.publish('org.freedesktop.UPower', FakeUPower(), ('devices/battery_BAT0', device))
+
+  elif name == 'wpa_supplicant':
+    interface_path = '/fi/w1/wpa_supplicant1/Interfaces/0'
+    bss_path = interface_path+'/BSSs/0'
+
+    class FakeWpaSupplicant:
+      dbus = '''
+        <node>
+          <interface name="fi.w1.wpa_supplicant1">
+            <property name="Interfaces" type="ao" access="read"/>
+            <signal name="InterfaceAdded"><arg type="o"/><arg type="a{sv}"/></signal>
+            <signal name="InterfaceRemoved"><arg type="o"/></signal>
+          </interface>
+        </node>
+      '''
+      InterfaceAdded = signal()
+      InterfaceRemoved = signal()
+      Interfaces = [interface_path]
+
+    class FakeInterface:
+      dbus = '''
+        <node>
+          <interface name="fi.w1.wpa_supplicant1.Interface">
+            <property name="Ifname" type="s" access="read"/>
+            <property name="State" type="s" access="read"/>
+            <property name="CurrentBSS" type="o" access="read"/>
+            <property name="BSSs" type="ao" access="read"/>
+            <signal name="BSSAdded"><arg type="o"/><arg type="a{sv}"/></signal>
+            <signal name="BSSRemoved"><arg type="o"/></signal>
+          </interface>
+        </node>
+      '''
+      BSSAdded = signal()
+      BSSRemoved = signal()
+      PropertiesChanged = signal()
+      Ifname = 'wlan0'
+      State = 'completed'
+      CurrentBSS = bss_path
+      BSSs = [bss_path]
+
+    class FakeBss:
+      dbus = '''
+        <node>
+          <interface name="fi.w1.wpa_supplicant1.BSS">
+            <property name="SSID" type="ay" access="read"/>
+            <property name="Signal" type="n" access="read"/>
+            <property name="Frequency" type="q" access="read"/>
+          </interface>
+        </node>
+      '''
+      PropertiesChanged = signal()
+      SSID = list(b'benchmark')
+      Signal = -50
+      Frequency = 5180
+
+    bss = FakeBss()
+    def emit(v, bss=bss):
+      # WlanApp displays a signal quality of 2 * (dBm + 100)
+      bss.Signal = v // 2 - 100
+      bss.PropertiesChanged('fi.w1.wpa_supplicant1.BSS', {'Signal': bss.Signal}, [])
+    bus = SystemBus()
+    bus.publish('fi.w1.wpa_supplicant1', FakeWpaSupplicant(),
+     ('Interfaces/0', FakeInterface()), ('Interfaces/0/BSSs/0', bss))
+
+  else:
+    raise ValueError('Unknown fake: '+name)
+
+  run_fake_commands(emit)
+  print('ready', flush=True)
+  GLib.MainLoop().run()
+
+
+
+#
+# App process
+#
+
+def context_switches():
+  total = 0
+  for task in os.listdir('/proc/self/task'):
+    with open('/proc/self/task/'+task+'/status') as f:
+      for line in f:
+        if line.startswith('voluntary_ctxt_switches') or line.startswith('nonvoluntary_ctxt_switches'):
+          total += int(line.split()[1])
+  return total
+
+def rss_kb():
+  with open('/proc/self/status') as f:
+    for line in f:
+      if line.startswith('VmRSS'):
+        return int(line.split()[1])
+
+# Run an app, report its startup metrics once it has been idle for `idle` seconds, then wait for
+# `dump` on stdin and report its label changes and statistics.
+def run_app(name, idle):
+  spawn_time = float(os.environ['BENCH_SPAWN_TIME'])
+  import importlib
+  import gi
+  gi.require_version('Gtkti', '3.0')
+  # tray_common pins the GTK version, so import it before loading Gtk
+  import tray_common
+  from gi.repository import Gtk, GLib
+  module_name, class_name, _fake, _regex = apps[name]
+  module = importlib.import_module(module_name)
+  if name == 'volume':
+    # Each line written to the named pipe in $BENCH_MIXER_FIFO sets the volume, as if another
+    # process had changed it (See mixers.FakeMixer)
+    import mixers
+    mixers.AlsaMixer = lambda **options: mixers.FakeMixer(os.environ['BENCH_MIXER_FIFO'])
+  app = getattr(module, class_name)()
+  if name == 'time':
+    # Update every second, so that there is something to measure
+    app.show_seconds = True
+    app.compile_formats()
+    app.gtk_update_ui()
+    app.timer.set_period(1)
+  elif name == 'wlan':
+    # The signal quality is the value that is measured (See apps)
+    app.show_signal = True
+
+  label_changes = []
+  app.tray_label.connect('notify::label', lambda label, pspec:
+   label_changes.append((time.monotonic(), time.time(), label.get_text())))
+  result = {'startup_s': None}
+  def drawn(widget, cr, result=result):
+    if result['startup_s'] is None:
+      result['startup_s'] = time.monotonic() - spawn_time
+    return False
+  app.tray_label.connect('draw', drawn)
+
+  def idle_start(result=result):
+    result['idle_start'] = (time.monotonic(), context_switches())
+    GLib.timeout_add(int(idle*1000), idle_end)
+    return False
+  def idle_end(result=result):
+    start_time, start_switches = result.pop('idle_start')
+    result['idle_wakeups_per_s'] = \
+     (context_switches() - start_switches) / (time.monotonic() - start_time)
+    result['rss_kb'] = rss_kb()
+    print('ready '+json.dumps(result), flush=True)
+    return False
+  # Let startup work settle before measuring idle wakeups
+  GLib.timeout_add(1000, idle_start)
+
+  def dump(extra=None):
+    stats = tray_common.get_stats()
+    print(json.dumps(dict(extra or {}, label_changes=label_changes, stats=stats)), flush=True)
+    Gtk.main_quit()
+  def command(fd, condition):
+    line = sys.stdin.readline()
+    if line.strip() == 'dump' and name == 'volume':
+      simulate_drags(app, lambda writes: dump({'slider_writes_per_drag': writes}))
+    elif line.strip() == 'dump' or not line:
+      dump()
+    return True
+  tray_common.watch_fd(sys.stdin.fileno(), GLib.IOCondition.IN, command)
+  tray_common.run()
+
+
+
+# Drag VolumeApp's popup slider `drag_count` times with mixer writes unthrottled (the behavior
+# before slider writes were throttled), then with the app's configured throttling, and call
+# done({mode: mixer writes per drag})
+drag_count = 5
+drag_steps = 60  # Slider value changes per drag
+drag_step_interval = 4  # ms ; Roughly the rate of pointer motion events from a 250 Hz mouse
+def simulate_drags(app, done):
+  from gi.repository import GLib
+  if not app.window:
+    app.build_window()
+  # Frame clock ticks (which throttled writes wait for) only occur while the window is mapped
+  app.window.show_all()
+  app.window_visible = True
+  modes = (('unthrottled', 0), ('throttled', app.slider_write_interval))
+  writes_per_drag = {}
+  def steps():
+    for mode, interval in modes:
+      app.slider_write_interval = interval
+      start_writes = app.slider_drag_writes
+      for d in range(drag_count):
+        app.slider_pressed()
+        for i in range(drag_steps):
+          app.slider.set_value(20 + i if d % 2 == 0 else 80 - i)
+          yield
+        app.slider_released()
+        yield
+      writes_per_drag[mode] = (app.slider_drag_writes - start_writes) / drag_count
+  iterator = steps()
+  def step():
+    try:
+      next(iterator)
+    except StopIteration:
+      app.window.hide()
+      app.window_visible = False
+      done(writes_per_drag)
+      return False
+    return True
+  GLib.timeout_add(drag_step_interval, step)
+
+
+
+#
+# Benchmark driver
+#
+
+def read_line(process, what):
+  ready, _, _ = select.select([process.stdout], [], [], timeout)
+  if not ready:
+    raise RuntimeError('Timed out waiting for '+what)
+  line = process.stdout.readline()
+  if not line:
+    raise RuntimeError(what+' exited')
+  return line.decode().strip()
+
+def spawn(args, env, **kwargs):
+  return subprocess.Popen([sys.executable, os.path.abspath(__file__)] + args, env=env,
+   stdin=subprocess.PIPE, stdout=subprocess.PIPE, **kwargs)
+
+def send(process, line):
+  process.stdin.write((line+'\n').encode())
+  process.stdin.flush()
+
+# Returns a list of (emission time, value)
+def drive(name, fake, fifo, mode, n, interval):
+  if fake:
+    send(fake, mode+' '+str(n)+' '+str(interval))
+    return json.loads(read_line(fake, 'fake '+name+' backend'))
+  emitted = []
+  with open(fifo, 'w') as f:
+    for i in range(n):
+      if mode == 'latency':
+        time.sleep(interval)
+      v = event_value(i)
+      emitted.append((time.monotonic(), v))
+      f.write(str(v)+'\n')
+      f.flush()
+  time.sleep(max(interval, 0.5))
+  return emitted
+
+def label_value(regex, text):
+  match = re.search(regex, text)
+  return match.group(1) if match else None
+
+def latencies(emitted, label_changes, regex):
+  emit_times = {}
+  for t, v in emitted:
+    emit_times.setdefault(v, []).append(t)
+  result = []
+  for t, _realtime, text in label_changes:
+    value = label_value(regex, text)
+    if value is None:
+      continue
+    # The most recent emission of this value that preceded the label change
+    times = [e for e in emit_times.get(int(value), []) if e <= t]
+    if times:
+      result.append(t - times[-1])
+  return result
+
+def bench_app(name, env, args, tmpdir):
+  _module, _class, fake_name, regex = apps[name]
+  fake = None
+  fifo = None
+  app = None
+  try:
+    if fake_name:
+      fake = spawn(['--fake', fake_name], env)
+      if read_line(fake, 'fake '+fake_name) != 'ready':
+        raise RuntimeError('Fake '+fake_name+' failed to start')
+    app_env = dict(env)
+    if name == 'volume':
+      fifo = os.path.join(tmpdir, 'mixer')
+      os.mkfifo(fifo)
+      app_env['BENCH_MIXER_FIFO'] = fifo
+    app_env['BENCH_SPAWN_TIME'] = repr(time.monotonic())
+    app = spawn(['--app', name, '--idle', str(args.idle)], app_env)
+    line = read_line(app, name)
+    if not line.startswith('ready '):
+      raise RuntimeError('Unexpected output from '+name+': '+line)
+    result = json.loads(line[len('ready '):])
+
+    lat_emitted = burst_emitted = []
+    if regex:
+      lat_emitted = drive(name, fake, fifo, 'latency', args.events, args.interval)
+      burst_emitted = drive(name, fake, fifo, 'burst', args.events, 0)
+    send(app, 'dump')
+    dump = json.loads(read_line(app, name))
+    label_changes = dump['label_changes']
+    result['stats'] = dump['stats']
+    if 'slider_writes_per_drag' in dump:
+      result['slider_writes_per_drag'] = dump['slider_writes_per_drag']
+
+    if regex:
+      if not any(label_value(regex, text) is not None for _t, _realtime, text in label_changes):
+        raise RuntimeError('No label of '+name+' matched '+regex)
+      lat = latencies(lat_emitted, [c for c in label_changes if c[0] <= burst_emitted[0][0]], regex)
+      # The burst is handled once the label shows the last value sent
+      last_value = str(burst_emitted[-1][1])
+      done = [t for t, _realtime, text in label_changes if t >= burst_emitted[0][0] and
+              label_value(regex, text) == last_value]
+      if not done:
+        raise RuntimeError(name+' never showed the last value of the burst')
+      result['events_per_s'] = len(burst_emitted) / (done[0] - burst_emitted[0][0])
+    else:
+      # TimeApp: time from each second boundary to the label change
+      lat = [realtime - int(realtime) for _t, realtime, _text in label_changes[1:]]
+    result['latency_ms'] = dict(('p'+str(p), None if not lat else percentile(lat, p) * 1000)
+     for p in (50, 90, 99, 100))
+    return result
+  finally:
+    for process in (app, fake):
+      if process and process.poll() is None:
+        process.terminate()
+        process.wait()
+
+def main():
+  parser = argparse.ArgumentParser(description='Benchmark the tray apps.')
+  parser.add_argument('--output', default='benchmark.json')
+  parser.add_argument('--events', type=int, default=50)
+  parser.add_argument('--interval', type=float, default=0.75)
+  parser.add_argument('--idle', type=float, default=10)
+  parser.add_argument('--tray-manager', default='stalonetray')
+  parser.add_argument('--fake', help=argparse.SUPPRESS)
+  parser.add_argument('--app', help=argparse.SUPPRESS)
+  parser.add_argument('apps', nargs='*')
+  args = parser.parse_args()
+
+  if args.fake:
+    return run_fake(args.fake)
+  if args.app:
+    return run_app(args.app, args.idle)
+
+  for name in args.apps:
+    if name not in apps:
+      parser.error('Unknown app: '+name)
+  processes = []
+  results = {}
+  with tempfile.TemporaryDirectory() as tmpdir:
+    try:
+      env = dict(os.environ)
+
+      # Virtual X server
+      read_fd, write_fd = os.pipe()
+      xvfb = subprocess.Popen(['Xvfb', '-displayfd', str(write_fd), '-nolisten', 'tcp'],
+       pass_fds=[write_fd], stderr=subprocess.DEVNULL)
+      processes.append(xvfb)
+      os.close(write_fd)
+      with os.fdopen(read_fd) as f:
+        env['DISPLAY'] = ':'+f.readline().strip()
+
+      # Stand-in tray manager
+      processes.append(subprocess.Popen(args.tray_manager.split(), env=env,
+       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+      time.sleep(1)
+
+      # Private message bus, used as the system bus by the apps and fake backends
+      dbus = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+       stdout=subprocess.PIPE)
+      processes.append(dbus)
+      env['DBUS_SYSTEM_BUS_ADDRESS'] = dbus.stdout.readline().decode().strip()
+
+      for name in (args.apps or list(apps)):
+        try:
+          results[name] = bench_app(name, env, args, tmpdir)
+        except Exception as e:
+          results[name] = {'error': str(e)}
+        print(name+': '+json.dumps(dict((k, v) for k, v in results[name].items() if k != 'stats')),
+         file=sys.stderr)
+    finally:
+      for process in reversed(processes):
+        process.terminate()
+        process.wait()
+
+  with open(args.output, 'w') as f:
+    json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+
+#
+# Copyright 2026 Paul Donohue <Tray_Apps@PaulSD.com>
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.  If
+# not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Mixer backends for volume_app.py
+# This module does not depend on GTK or GLib (the main loop is passed in to MixerMonitor), so that
+# the backends can be tested and benchmarked without a display.
+#
+# Each backend is a MixerState subclass, which provides the same interface to the tray label, the
+# popup window, and the scroll handler:
+#   volume, muted: Cached state (volume is 0-100)
+#   set_volume(volume), set_mute(muted): Change the state, and update the cached state
+#   poll_descriptors(): List of (fd, eventmask) to watch for changes made by other processes
+#   handle_events(): Call when a poll descriptor is ready.  Returns true if the cached state may
+#    have changed.
+#   retry_delay(): Call when a poll descriptor reports an error or hangup.  Returns the number of
+#    seconds to wait before calling reopen(), or `None` if the backend can't be reopened.
+#   reopen(): Re-establish the backend's poll descriptors (and refresh the cached state)
+#   close(): Release the backend's resources
+#   get_stats(): Returns a dict of statistics (See tray_common.register_stats)
+#
+
+import sys, os
+import select
+import subprocess
+
+# Cached mixer state
+# Backends implement read_state(), write_volume(), write_mute(), and read_events().  The cached
+# state is only re-read when read_events() reports a change made by another process, and a write is
+# only made when the requested state differs from the cached state.
+# Backends that can be reopened override retry_delay() (usually using backoff()) and reopen().  By
+# default, a backend whose poll descriptor is closed is never reopened.
+class MixerState:
+
+  def __init__(self, max_backoff=60):
+    self.volume = None
+    self.muted = None
+    self.max_backoff = max_backoff  # seconds
+    self.failures = 0  # Consecutive reopen failures
+    self.reads = 0
+    self.writes = 0
+
+  def refresh(self):
+    self.volume, self.muted = self.read_state()
+
+  def set_volume(self, volume):
+    volume = min(100, max(0, int(volume)))
+    if volume != self.volume:
+      self.volume = self.write_volume(volume)
+      self.writes += 1
+
+  def set_mute(self, muted):
+    muted = bool(muted)
+    if muted != self.muted:
+      self.write_mute(muted)
+      self.muted = muted
+      self.writes += 1
+
+  def handle_events(self):
+    if not self.read_events():
+      return False
+    self.refresh()
+    return True
+
+  def retry_delay(self):
+    print(type(self).__name__+' poll descriptor closed', file=sys.stderr)
+    return None
+
+  # Returns the delay before the next reopen attempt, which doubles after each consecutive failure
+  # (up to `max_backoff` seconds)
+  def backoff(self):
+    delay = min(2 ** min(self.failures, 30), self.max_backoff)
+    self.failures += 1
+    return delay
+
+  def close(self):
+    pass
+
+  def get_stats(self):
+    return {
+      'reads': self.reads,
+      'writes': self.writes,
+    }
+
+# ALSA mixer control
+# Every getvolume()/getmute() call is an ioctl round trip, so the state is only re-read when the
+# mixer's poll descriptors report a change (made by another process), or after we make a change
+# (since the hardware may round the volume to its own step size).
+# If the device is removed (such as when a USB sound card is unplugged), the mixer is reopened with
+# exponential backoff (up to `max_backoff` seconds), so the control is monitored again once the
+# device is plugged back in.
+class AlsaMixer(MixerState):
+
+  # If `capture` is true, the capture volume and capture switch of the control are used instead of
+  # the playback volume and mute switch
+  def __init__(self, device='default', control='Master', capture=False, max_backoff=60):
+    super().__init__(max_backoff)
+    import alsaaudio  # See /usr/share/doc/python-alsaaudio/examples/mixertest.py
+    self.alsaaudio = alsaaudio
+    self.device = device
+    self.control = control
+    self.mixer = alsaaudio.Mixer(control=control, device=device)
+    self.capture = capture
+    self.pcmtype = alsaaudio.PCM_CAPTURE if capture else alsaaudio.PCM_PLAYBACK
+    self.reopens = 0
+    self.refresh()
+
+  def read_state(self):
+    volume = self.mixer.getvolume(pcmtype=self.pcmtype)[0]
+    if self.capture:
+      muted = not self.mixer.getrec()[0]
+    else:
+      muted = bool(self.mixer.getmute()[0])
+    self.reads += 2
+    return volume, muted
+
+  def write_volume(self, volume):
+    self.mixer.setvolume(volume, pcmtype=self.pcmtype)
+    self.reads += 1
+    return self.mixer.getvolume(pcmtype=self.pcmtype)[0]
+
+  def write_mute(self, muted):
+    if self.capture:
+      self.mixer.setrec(int(not muted))
+    else:
+      self.mixer.setmute(int(muted))
+
+  def poll_descriptors(self):
+    return self.mixer.polldescriptors()
+
+  def read_events(self):
+    # We don't get events when we make changes, only when other processes make changes
+    self.mixer.handleevents()
+    return True
+
+  def retry_delay(self):
+    delay = self.backoff()
+    print('ALSA mixer '+self.control+' on '+self.device+' closed, reopening in '+str(delay)+
+     ' seconds', file=sys.stderr)
+    return delay
+
+  def reopen(self):
+    self.close()
+    self.mixer = self.alsaaudio.Mixer(control=self.control, device=self.device)
+    self.failures = 0
+    self.reopens += 1
+    self.refresh()
+
+  def close(self):
+    if self.mixer:
+      try:
+        self.mixer.close()
+      except self.alsaaudio.ALSAAudioError:
+        pass
+      self.mixer = None
+
+  def get_stats(self):
+    stats = super().get_stats()
+    stats['reopens'] = self.reopens
+    return stats
+
+# PulseAudio sink (also works with PipeWire via pipewire-pulse)
+# The sink is controlled using pulsectl.  pulsectl can only wait for events by blocking, so events
+# are received from a `pactl subscribe` child process instead, whose output is watched by the main
+# loop.  This is a server-side subscription, so nothing is polled.  If `pactl subscribe` exits (for
+# example, because the sound server was restarted), it is restarted with exponential backoff (up to
+# `max_backoff` seconds), along with the pulsectl connection.
+class PulseMixer(MixerState):
+
+  def __init__(self, sink=None, max_backoff=60):
+    super().__init__(max_backoff)
+    import pulsectl
+    self.pulsectl = pulsectl
+    self.pulse = pulsectl.Pulse('tray-volume-app')
+    self.sink_name = sink  # `None` for the default sink
+    self.events = 0
+    self.restarts = 0
+    self.subscriber = None
+    self.start_subscriber()
+    self.refresh()
+
+  def start_subscriber(self):
+    self.subscriber = subprocess.Popen(['pactl', 'subscribe'], stdout=subprocess.PIPE,
+     stdin=subprocess.DEVNULL)
+    os.set_blocking(self.subscriber.stdout.fileno(), False)
+    self.event_buffer = b''
+
+  def stop_subscriber(self):
+    subscriber = self.subscriber
+    if not subscriber:
+      return
+    self.subscriber = None
+    if subscriber.poll() is None:
+      subscriber.terminate()
+      try:
+        subscriber.wait(timeout=1)
+      except subprocess.TimeoutExpired:
+        subscriber.kill()
+        subscriber.wait()
+    subscriber.stdout.close()
+
+  def read_state(self):
+    if self.sink_name:
+      self.sink = self.pulse.get_sink_by_name(self.sink_name)
+    else:
+      self.sink = self.pulse.get_sink_by_name(self.pulse.server_info().default_sink_name)
+      self.reads += 1
+    self.reads += 1
+    return int(round(self.sink.volume.value_flat * 100)), bool(self.sink.mute)
+
+  def write_volume(self, volume):
+    self.pulse.volume_set_all_chans(self.sink, volume / 100.0)
+    return volume
+
+  def write_mute(self, muted):
+    self.pulse.mute(self.sink, muted)
+
+  def poll_descriptors(self):
+    return [(self.subscriber.stdout.fileno(), select.POLLIN)]
+
+  def read_events(self):
+    try:
+      data = os.read(self.subscriber.stdout.fileno(), 4096)
+    except BlockingIOError:
+      return False
+    if not data:
+      # `pactl subscribe` exited.  The main loop reports a hangup next (See retry_delay()).
+      return False
+    self.failures = 0
+    # Events look like: Event 'change' on sink #0
+    lines = (self.event_buffer + data).split(b'\n')
+    self.event_buffer = lines.pop()
+    changed = False
+    for line in lines:
+      self.events += 1
+      if b' on sink #' in line or b' on server' in line:
+        changed = True
+    return changed
+
+  def retry_delay(self):
+    delay = self.backoff()
+    if self.subscriber:
+      reason = 'pactl subscribe exited (status '+str(self.subscriber.poll())+')'
+    else:
+      reason = 'Failed to reconnect to the sound server'
+    print(reason+', retrying in '+str(delay)+' seconds', file=sys.stderr)
+    return delay
+
+  def reopen(self):
+    self.stop_subscriber()
+    # The sound server has probably been restarted, so the pulsectl connection is also stale
+    self.pulse.close()
+    self.pulse = self.pulsectl.Pulse('tray-volume-app')
+    self.start_subscriber()
+    self.restarts += 1
+    self.refresh()
+
+  def close(self):
+    self.stop_subscriber()
+    self.pulse.close()
+
+  def get_stats(self):
+    stats = super().get_stats()
+    stats.update({
+      'events': self.events,
+      'restarts': self.restarts,
+    })
+    return stats
+
+# Mixer whose changes by "other processes" are made by calling external_change(), or by writing
+# lines of "<volume> [<muted>]" to the named pipe at `path` (or to an anonymous pipe if `path` is
+# `None`).  Used by tests and by benchmark.py.
+class FakeMixer(MixerState):
+
+  def __init__(self, path=None, volume=50, muted=False):
+    super().__init__()
+    self.path = path
+    self.hardware_volume = volume
+    self.hardware_muted = muted
+    self.reopen_delay = None  # Returned by retry_delay()
+    self.reopens = 0
+    self.open()
+    self.refresh()
+
+  def open(self):
+    if self.path:
+      self.fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+      # Keep the pipe open for writing too, so that it never reports a hangup between writers
+      self.write_fd = os.open(self.path, os.O_WRONLY)
+    else:
+      self.fd, self.write_fd = os.pipe()
+      os.set_blocking(self.fd, False)
+    self.buffer = b''
+
+  def external_change(self, volume, muted=False):
+    os.write(self.write_fd, (str(volume)+' '+str(int(muted))+'\n').encode())
+
+  # Simulate the device being removed (or the sound server exiting)
+  def hang_up(self):
+    os.close(self.write_fd)
+    self.write_fd = None
+
+  def read_state(self):
+    self.reads += 1
+    return self.hardware_volume, self.hardware_muted
+
+  def write_volume(self, volume):
+    self.hardware_volume = volume
+    return volume
+
+  def write_mute(self, muted):
+    self.hardware_muted = muted
+
+  def poll_descriptors(self):
+    return [(self.fd, select.POLLIN)]
+
+  def read_events(self):
+    try:
+      data = os.read(self.fd, 4096)
+    except BlockingIOError:
+      return False
+    lines = (self.buffer + data).split(b'\n')
+    self.buffer = lines.pop()
+    for line in lines:
+      fields = line.split()
+      self.hardware_volume = int(fields[0])
+      if len(fields) > 1:
+        self.hardware_muted = fields[1] == b'1'
+    return bool(lines)
+
+  def retry_delay(self):
+    return self.reopen_delay
+
+  def reopen(self):
+    self.close()
+    self.open()
+    self.reopens += 1
+    self.refresh()
+
+  def close(self):
+    os.close(self.fd)
+    if self.write_fd is not None:
+      os.close(self.write_fd)
+      self.write_fd = None
+
+# Watches the poll descriptors of a list of mixers
+# The poll descriptors of every mixer (some expose more than one) are watched by the main loop, and
+# each event is dispatched only to the mixer that owns the descriptor, so the cost of monitoring
+# scales with the number of events rather than the number of mixers.  If a descriptor reports an
+# error or hangup, the mixer's descriptors are unwatched, and the mixer is reopened after its
+# retry_delay() (if any).  on_change(mixer) is called whenever a mixer's cached state may have
+# changed.
+# The main loop is accessed through the following functions (which match GLib's):
+#   watch_fd(fd, eventmask, callback): Call callback(fd, condition) when the fd is ready, until the
+#    callback returns false.  Returns a source ID.
+#   remove_watch(source_id): Stop watching an fd
+#   call_later(delay, callback, *args): Call callback(*args) after `delay` seconds, until it returns
+#    false
+class MixerMonitor:
+
+  ERROR_CONDITIONS = select.POLLERR | select.POLLHUP | select.POLLNVAL
+
+  def __init__(self, mixers, on_change, watch_fd, remove_watch, call_later):
+    self.on_change = on_change
+    self.watch_fd = watch_fd
+    self.remove_watch = remove_watch
+    self.call_later = call_later
+    self.fds = {}  # fd -> (mixer, source ID)
+    self.events = 0
+    self.closed = 0
+    self.reopens = 0
+    for mixer in mixers:
+      self.watch(mixer)
+
+  def watch(self, mixer):
+    for fd, eventmask in mixer.poll_descriptors():
+      self.fds[fd] = (mixer, self.watch_fd(fd, eventmask, self.fd_ready))
+
+  def unwatch(self, mixer, current_fd):
+    for fd, (fd_mixer, source) in list(self.fds.items()):
+      if fd_mixer is mixer:
+        del self.fds[fd]
+        # The source of the current fd is removed when fd_ready() returns false
+        if fd != current_fd:
+          self.remove_watch(source)
+
+  def fd_ready(self, fd, condition):
+    if fd not in self.fds:
+      return False
+    mixer = self.fds[fd][0]
+    self.events += 1
+    if condition & select.POLLIN:
+      try:
+        if mixer.handle_events():
+          self.on_change(mixer)
+      except Exception as e:
+        # Reading from a device that has just been removed usually fails before a hangup is reported
+        print('Failed to read '+type(mixer).__name__+' events: '+str(e), file=sys.stderr)
+        condition |= select.POLLERR
+    if condition & self.ERROR_CONDITIONS:
+      # The device has probably been removed (or the sound server has exited)
+      self.closed += 1
+      self.unwatch(mixer, fd)
+      self.schedule_reopen(mixer)
+      return False
+    # Return true to keep this method registered as a main loop fd handler
+    return True
+
+  def schedule_reopen(self, mixer):
+    delay = mixer.retry_delay()
+    if delay is not None:
+      self.call_later(delay, self.reopen, mixer)
+
+  def reopen(self, mixer):
+    try:
+      mixer.reopen()
+    except Exception as e:
+      print('Failed to reopen '+type(mixer).__name__+': '+str(e), file=sys.stderr)
+      self.schedule_reopen(mixer)
+      return False
+    self.reopens += 1
+    self.watch(mixer)
+    self.on_change(mixer)
+    # Return false to unregister this method as a main loop timeout handler
+    return False
+
+  def get_stats(self):
+    return {
+      'fds': len(self.fds),
+      'events': self.events,
+      'closed': self.closed,
+      'reopens': self.reopens,
+    }
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+#
+# Copyright 2026 Paul Donohue <Tray_Apps@PaulSD.com>
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.  If
+# not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Power supplies read directly from sysfs, for battery_app.py's 'sysfs' backend
+# This module does not depend on GTK or GLib, so that it can be tested against a fake sysfs tree:
+# Each subdirectory of the root (normally /sys/class/power_supply) should contain a `uevent` file
+# containing POWER_SUPPLY_*=value lines.
+# Each battery is converted to a dict of UPower Device properties, so that it is displayed the same
+# way as a battery reported by UPower.  (Peripheral batteries are not reported.)
+#
+
+import os
+
+# UPower device type and states (See https://upower.freedesktop.org/docs/Device.html)
+UPOWER_TYPE_BATTERY = 2
+SYSFS_STATES = {
+  'Charging': 1, 'Discharging': 2, 'Empty': 3, 'Full': 4, 'Not charging': 5,
+}
+
+# Returns a dict of the KEY=value lines in a uevent file
+# Lines without a `=` are ignored, and invalid UTF-8 is replaced, since a misbehaving driver should
+# not prevent the other power supplies from being read.
+def read_uevent(path):
+  uevent = {}
+  with open(path, errors='replace') as f:
+    for line in f:
+      key, sep, value = line.rstrip('\n').partition('=')
+      if sep and key:
+        uevent[key] = value
+  return uevent
+
+# Returns a dict of UPower Device properties for each system battery under `root`, keyed by path
+# Raises OSError if `root` can't be read.
+def read_power_supplies(root):
+  devices = {}
+  for name in sorted(os.listdir(root)):
+    path = os.path.join(root, name)
+    try:
+      uevent = read_uevent(os.path.join(path, 'uevent'))
+    except OSError:
+      # The power supply was removed while scanning (or is not a power supply)
+      continue
+    props = get_power_supply_properties(name, uevent)
+    if props:
+      devices[path] = props
+  return devices
+
+# Returns a dict of UPower Device properties, or None if the power supply is not a system battery
+def get_power_supply_properties(name, uevent):
+  def value(key, default=None, uevent=uevent):
+    v = uevent.get('POWER_SUPPLY_'+key)
+    try:
+      return int(v) if v is not None else default
+    except ValueError:
+      return default
+  if uevent.get('POWER_SUPPLY_TYPE') != 'Battery' or \
+     uevent.get('POWER_SUPPLY_SCOPE') == 'Device' or value('PRESENT', 1) == 0:
+    return None
+  state = SYSFS_STATES.get(uevent.get('POWER_SUPPLY_STATUS'), 0)
+  # Batteries report either energy (uWh) and power (uW), or charge (uAh) and current (uA)
+  energy = value('ENERGY_NOW')
+  if energy is not None:
+    now = energy
+    full = value('ENERGY_FULL')
+    rate = abs(value('POWER_NOW', 0))
+  else:
+    now = value('CHARGE_NOW')
+    full = value('CHARGE_FULL')
+    rate = abs(value('CURRENT_NOW', 0))
+  percentage = value('CAPACITY')
+  if percentage is None:
+    percentage = 100 * now / full if now is not None and full else 0
+  percentage = min(100, max(0, percentage))
+  time_to_empty = time_to_full = 0
+  if rate and now is not None:
+    if state == 2:
+      time_to_empty = int(3600 * now / rate)
+    elif state == 1 and full:
+      time_to_full = int(3600 * max(0, full - now) / rate)
+  props = {
+    'NativePath': name,
+    'Model': uevent.get('POWER_SUPPLY_MODEL_NAME', ''),
+    'Type': UPOWER_TYPE_BATTERY,
+    'PowerSupply': True,
+    'State': state,
+    'Percentage': float(percentage),
+    'TimeToEmpty': time_to_empty,
+    'TimeToFull': time_to_full,
+  }
+  if energy is not None:
+    props['Energy'] = energy / 1000000.0  # Wh
+    props['EnergyRate'] = rate / 1000000.0  # W
+  return props
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+#
+# Copyright 2026 Paul Donohue <Tray_Apps@PaulSD.com>
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.  If
+# not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Prerequisites:
+# Install GtkTrayIcon (from the gtktrayicon/ subdirectory)
+# Keep tray_common.py in the same directory as this script
+# sudo apt-get install --no-install-recommends libgirepository1.0-dev gobject-introspection \
+#  gir1.2-gtk-3.0
+#
+
+# Use `None` for a transparent background.
+# In Ubuntu 18.04 (trayer 1.1.7, gtk 3.22.30), transparency worked fine.  However, in Ubuntu 20.04
+# (trayer 1.1.8, gtk 3.24.20), transparency does not work.  Specifically, the visual area of the
+# icon is never cleared, so at startup any existing icon that was moved to make space for the new
+# icon will remain visible in the new icon's background, and any updates to the icon text will draw
+# over the previous text.  I'm not sure what is causing it, but a simple fix is to set a background
+# color instead of using a transparent background.
+#background_color = None
+background_color = '#9A9A9A'
+
+
+
+import gi
+gi.require_version('Gtkti', '3.0')
+from gi.repository import Gtkti, Gtk, Gdk, GLib
+import tray_common
+import os
+import array
+import time
+
+# A file in /proc that is kept open and re-read from the start on every tick
+# procfs regenerates the contents of these files on every read from offset 0, so the file never
+# needs to be re-opened, and each read fills the same buffer instead of allocating a new one.  Only
+# the start of each file is needed (the first line of /proc/stat, and the first few lines of
+# /proc/meminfo), so the buffers are small even on systems with many CPUs.
+class ProcFile:
+
+  def __init__(self, path, size):
+    self.fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    self.buffer = bytearray(size)
+    self.buffers = [self.buffer]
+    self.length = 0
+
+  def read(self):
+    self.length = os.preadv(self.fd, self.buffers, 0)
+    return self.buffer
+
+  # Returns the integer value of the `field`th whitespace-separated field after `start`
+  def field(self, start, index):
+    buffer = self.buffer
+    pos = start
+    end = self.length
+    for _ in range(index+1):
+      while pos < end and buffer[pos] == 32:  # ' '
+        pos += 1
+      field_start = pos
+      while pos < end and buffer[pos] > 32:
+        pos += 1
+    return int(buffer[field_start:pos])
+
+# WARNING: Variable scope for Python inline functions and lambdas does not work like other
+# languages!  To ensure that definition-scope variables are passed into the function/lambda's scope
+# as expected, explicitly add 'var=var' (optional/defaulted) parameters to the end of the function/
+# lambda's parameter list.
+
+class SysLoadApp:
+
+  def __init__(self):
+    self.prefix = ''
+    self.separator = ' '
+    self.suffix = ' '
+    self.show_cpu = True
+    self.show_memory = True
+    self.show_load = True
+    self.tooltip_heading = 'System Load:\n'
+
+    self.update_interval = 2  # seconds
+    # Number of samples to keep.  The label shows CPU usage since the previous sample, and the
+    # tooltip also shows the average CPU usage over all of the samples.
+    self.history = 16
+
+    self.stat = ProcFile('/proc/stat', 256)
+    self.meminfo = ProcFile('/proc/meminfo', 256)
+    self.loadavg = ProcFile('/proc/loadavg', 64)
+    # Ring buffers of cumulative CPU time (in clock ticks), indexed by sample number % history
+    self.cpu_total = array.array('Q', bytes(8 * self.history))
+    self.cpu_idle = array.array('Q', bytes(8 * self.history))
+    self.samples = 0
+
+    # For troubleshooting and performance monitoring (See tray_common.register_stats)
+    self.ticks = 0
+    self.tick_time_total = 0
+    self.tick_time_max = 0
+    self.tick_time_last = 0
+    tray_common.register_stats('SysLoadApp.tick', lambda self=self: {
+      'ticks': self.ticks,
+      'time_total_us': int(self.tick_time_total * 1000000),
+      'time_max_us': int(self.tick_time_max * 1000000),
+      'time_last_us': int(self.tick_time_last * 1000000),
+    })
+
+    self.build_ui()
+    self.gtk_update_ui()
+    tray_common.mark_startup('SysLoadApp', 'ui_built')
+    # timeout_add_seconds() lets GLib batch this wakeup with other once-per-second timers
+    GLib.timeout_add_seconds(self.update_interval, self.gtk_update_ui)
+
+  def build_ui(self):
+    self.tray = tray = Gtkti.TrayIcon()
+    self.eventbox = eventbox = Gtk.EventBox()
+    if background_color:
+      tray_common.set_background_color(background_color)
+    eventbox.set_tooltip_text(self.tooltip_heading+'Unknown')
+    tray.add(eventbox)
+    self.tray_label = tray_label = Gtk.Label(label=self.prefix+self.suffix)
+    eventbox.add(tray_label)
+    tray.show_all()
+    self.renderer = tray_common.Renderer('SysLoadApp', tray_label, eventbox)
+
+    menu = Gtk.Menu()
+    item_quit = Gtk.MenuItem(label='Quit')
+    def quit(menu_item):
+      Gtk.main_quit()
+    item_quit.connect('activate', quit)
+    menu.append(item_quit)
+    menu.show_all()
+    def button_pressed(eventbox, event, menu=menu):
+      if event.type == Gdk.EventType.BUTTON_PRESS and event.button == 3:
+        menu.popup(None, None, None, None, event.button, event.time)
+    eventbox.connect('button-press-event', button_pressed)
+
+  # Returns (CPU usage since the previous sample, average CPU usage over the history) as percentages
+  def sample_cpu(self):
+    stat = self.stat
+    stat.read()
+    # First line: cpu user nice system idle iowait irq softirq steal guest guest_nice
+    # (guest time is also included in user time)
+    total = 0
+    for i in range(1, 9):
+      total += stat.field(0, i)
+    idle = stat.field(0, 4) + stat.field(0, 5)
+    n = self.history
+    i = self.samples % n
+    self.cpu_total[i] = total
+    self.cpu_idle[i] = idle
+    self.samples += 1
+    if self.samples < 2:
+      return None, None
+    prev = (i - 1) % n
+    oldest = (i - min(self.samples - 1, n - 1)) % n
+    return (self.cpu_usage(total - self.cpu_total[prev], idle - self.cpu_idle[prev]),
+     self.cpu_usage(total - self.cpu_total[oldest], idle - self.cpu_idle[oldest]))
+
+  def cpu_usage(self, total, idle):
+    return 100 * (total - idle) // total if total else 0
+
+  # Returns (total, available) in KiB
+  def sample_memory(self):
+    meminfo = self.meminfo
+    buffer = meminfo.read()
+    total = available = 0
+    pos = 0
+    while pos < meminfo.length and not (total and available):
+      if buffer.startswith(b'MemTotal:', pos):
+        total = meminfo.field(pos, 1)
+      elif buffer.startswith(b'MemAvailable:', pos):
+        available = meminfo.field(pos, 1)
+      pos = buffer.find(b'\n', pos, meminfo.length) + 1
+      if not pos:
+        break
+    return total, available
+
+  # Update the UI (within the GTK main thread ; not thread-safe)
+  def gtk_update_ui(self):
+    start = time.perf_counter()
+    display_strs = []
+    tooltip_str = ''
+    cpu, cpu_average = self.sample_cpu()
+    if self.show_cpu:
+      display_strs.append('C:'+('?' if cpu is None else str(cpu)+'%'))
+    if cpu is not None:
+      tooltip_str += 'CPU: '+str(cpu)+'% (Average '+str(cpu_average)+'%)\n'
+    mem_total, mem_available = self.sample_memory()
+    if mem_total:
+      mem_used = 100 * (mem_total - mem_available) // mem_total
+      if self.show_memory:
+        display_strs.append('M:'+str(mem_used)+'%')
+      tooltip_str += 'Memory: '+str(mem_used)+'% ('+str((mem_total - mem_available) // 1024)+ \
+       ' of '+str(mem_total // 1024)+' MiB used)\n'
+    loadavg = self.loadavg.read()[:self.loadavg.length].split(b' ', 3)
+    if self.show_load:
+      display_strs.append('L:'+loadavg[0].decode())
+    tooltip_str += 'Load: '+b' '.join(loadavg[:3]).decode()
+    self.renderer.render(self.prefix+self.separator.join(display_strs)+self.suffix,
+     self.tooltip_heading+tooltip_str)
+
+    tick_time = time.perf_counter() - start
+    self.ticks += 1
+    self.tick_time_total += tick_time
+    self.tick_time_max = max(self.tick_time_max, tick_time)
+    self.tick_time_last = tick_time
+
+    # Return true to keep this method registered as a GLib timeout handler
+    return True
+
+if __name__ == '__main__':
+  SysLoadApp()
+
+  tray_common.run()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+#
+# Copyright 2026 Paul Donohue <Tray_Apps@PaulSD.com>
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.  If
+# not, see <http://www.gnu.org/licenses/>.
+#
+
+# Usage: python3 -m unittest discover tests
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import select
+import unittest
+import mixers
+
+# Minimal stand-in for the GLib main loop functions used by MixerMonitor
+class FakeLoop:
+
+  def __init__(self):
+    self.sources = {}  # source ID -> (fd, eventmask, callback)
+    self.next_source = 1
+    self.timers = []  # (delay, callback, args)
+
+  def watch_fd(self, fd, eventmask, callback):
+    source = self.next_source
+    self.next_source += 1
+    self.sources[source] = (fd, eventmask, callback)
+    return source
+
+  def remove_watch(self, source):
+    del self.sources[source]
+
+  def call_later(self, delay, callback, *args):
+    self.timers.append((delay, callback, args))
+
+  # Dispatch every ready fd once
+  def iterate(self):
+    poll = select.poll()
+    for fd, eventmask, _callback in self.sources.values():
+      poll.register(fd, eventmask)
+    ready = dict(poll.poll(0))
+    for source, (fd, _eventmask, callback) in list(self.sources.items()):
+      if fd in ready and source in self.sources and not callback(fd, ready[fd]):
+        del self.sources[source]
+
+  def run_timers(self):
+    timers = self.timers
+    self.timers = []
+    for _delay, callback, args in timers:
+      callback(*args)
+
+class MixerStateTest(unittest.TestCase):
+
+  def setUp(self):
+    self.mixer = mixers.FakeMixer(volume=40)
+    self.addCleanup(self.mixer.close)
+
+  def test_initial_state_is_read_once(self):
+    self.assertEqual((self.mixer.volume, self.mixer.muted), (40, False))
+    self.assertEqual(self.mixer.reads, 1)
+
+  def test_unchanged_writes_are_skipped(self):
+    self.mixer.set_volume(40)
+    self.mixer.set_mute(False)
+    self.assertEqual(self.mixer.writes, 0)
+    self.mixer.set_volume(55)
+    self.mixer.set_volume(55)
+    self.mixer.set_mute(True)
+    self.mixer.set_mute(1)
+    self.assertEqual(self.mixer.writes, 2)
+    self.assertEqual((self.mixer.volume, self.mixer.muted), (55, True))
+    self.assertEqual((self.mixer.hardware_volume, self.mixer.hardware_muted), (55, True))
+
+  def test_volume_is_clamped(self):
+    self.mixer.set_volume(140)
+    self.assertEqual(self.mixer.volume, 100)
+    self.mixer.set_volume(-3.5)
+    self.assertEqual(self.mixer.volume, 0)
+
+  def test_writes_do_not_reread_state(self):
+    self.mixer.set_volume(10)
+    self.mixer.set_mute(True)
+    self.assertEqual(self.mixer.reads, 1)
+
+  def test_no_events(self):
+    self.assertFalse(self.mixer.handle_events())
+    self.assertEqual(self.mixer.reads, 1)
+
+  def test_external_change_refreshes_cache(self):
+    self.mixer.external_change(70, True)
+    self.assertTrue(self.mixer.handle_events())
+    self.assertEqual((self.mixer.volume, self.mixer.muted), (70, True))
+    self.assertEqual(self.mixer.reads, 2)
+
+  def test_backoff(self):
+    self.mixer.max_backoff = 10
+    self.assertEqual([self.mixer.backoff() for _ in range(6)], [1, 2, 4, 8, 10, 10])
+    self.mixer.failures = 5000
+    self.assertEqual(self.mixer.backoff(), 10)
+
+  def test_closed_mixer_is_not_reopened_by_default(self):
+    self.assertIsNone(mixers.MixerState.retry_delay(self.mixer))
+
+class MixerMonitorTest(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = FakeLoop()
+    self.mixers = [mixers.FakeMixer(volume=20), mixers.FakeMixer(volume=30)]
+    for mixer in self.mixers:
+      self.addCleanup(mixer.close)
+    self.changes = []
+    self.monitor = mixers.MixerMonitor(self.mixers, self.changes.append, self.loop.watch_fd,
+     self.loop.remove_watch, self.loop.call_later)
+
+  def test_watches_every_descriptor(self):
+    self.assertEqual(len(self.loop.sources), 2)
+    self.assertEqual(self.monitor.get_stats()['fds'], 2)
+
+  def test_event_is_dispatched_to_owning_mixer(self):
+    self.mixers[1].external_change(35)
+    self.loop.iterate()
+    self.assertEqual(self.changes, [self.mixers[1]])
+    self.assertEqual(self.mixers[1].volume, 35)
+    self.assertEqual(self.mixers[0].reads, 1)
+    self.assertEqual(self.monitor.get_stats()['events'], 1)
+
+  def test_idle_loop_dispatches_nothing(self):
+    self.loop.iterate()
+    self.assertEqual(self.changes, [])
+    self.assertEqual(self.monitor.get_stats()['events'], 0)
+
+  def test_hangup_without_retry_unwatches_mixer(self):
+    self.mixers[0].hang_up()
+    self.loop.iterate()
+    self.assertEqual(len(self.loop.sources), 1)
+    self.assertEqual(self.loop.timers, [])
+    self.assertEqual(self.monitor.get_stats()['closed'], 1)
+    # The other mixer is still monitored
+    self.mixers[1].external_change(80)
+    self.loop.iterate()
+    self.assertEqual(self.changes, [self.mixers[1]])
+
+  def test_hangup_with_retry_reopens_mixer(self):
+    mixer = self.mixers[0]
+    mixer.reopen_delay = 2
+    mixer.external_change(25)
+    mixer.hang_up()
+    self.loop.iterate()
+    # Pending events are handled before the hangup
+    self.assertEqual(self.changes, [mixer])
+    self.assertEqual(mixer.volume, 25)
+    self.assertEqual([delay for delay, _callback, _args in self.loop.timers], [2])
+    self.loop.run_timers()
+    self.assertEqual(mixer.reopens, 1)
+    self.assertEqual(self.monitor.get_stats()['reopens'], 1)
+    self.assertEqual(len(self.loop.sources), 2)
+    mixer.external_change(60)
+    self.loop.iterate()
+    self.assertEqual(mixer.volume, 60)
+    self.assertEqual(self.changes, [mixer, mixer, mixer])
+
+  def test_failed_reopen_is_retried(self):
+    mixer = self.mixers[0]
+    mixer.reopen_delay = 1
+    failures = []
+    def reopen(mixer=mixer):
+      failures.append(True)
+      raise OSError('No such device')
+    mixer.reopen = reopen
+    mixer.hang_up()
+    self.loop.iterate()
+    self.loop.run_timers()
+    self.assertEqual(len(failures), 1)
+    self.assertEqual(len(self.loop.timers), 1)
+    self.assertEqual(self.monitor.get_stats()['reopens'], 0)
+
+  def test_read_error_is_treated_as_hangup(self):
+    mixer = self.mixers[0]
+    mixer.reopen_delay = 1
+    def read_events():
+      raise OSError('No such device')
+    mixer.read_events = read_events
+    mixer.external_change(25)
+    self.loop.iterate()
+    self.assertEqual(self.changes, [])
+    self.assertEqual(len(self.loop.sources), 1)
+    self.assertEqual(self.monitor.get_stats()['closed'], 1)
+    del mixer.read_events
+    self.loop.run_timers()
+    self.assertEqual(mixer.reopens, 1)
+    self.assertEqual(len(self.loop.sources), 2)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+#
+# Copyright 2026 Paul Donohue <Tray_Apps@PaulSD.com>
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.  If
+# not, see <http://www.gnu.org/licenses/>.
+#
+
+# Usage: python3 -m unittest discover tests
+
+import sys, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import shutil
+import tempfile
+import unittest
+import power_supplies
+
+ENERGY_BATTERY = {
+  'POWER_SUPPLY_NAME': 'BAT0',
+  'POWER_SUPPLY_TYPE': 'Battery',
+  'POWER_SUPPLY_STATUS': 'Discharging',
+  'POWER_SUPPLY_PRESENT': '1',
+  'POWER_SUPPLY_POWER_NOW': '10000000',
+  'POWER_SUPPLY_ENERGY_FULL': '50000000',
+  'POWER_SUPPLY_ENERGY_NOW': '20000000',
+  'POWER_SUPPLY_CAPACITY': '40',
+  'POWER_SUPPLY_MODEL_NAME': 'Fake Battery',
+}
+
+CHARGE_BATTERY = {
+  'POWER_SUPPLY_TYPE': 'Battery',
+  'POWER_SUPPLY_STATUS': 'Charging',
+  'POWER_SUPPLY_CURRENT_NOW': '-1000000',
+  'POWER_SUPPLY_CHARGE_FULL': '4000000',
+  'POWER_SUPPLY_CHARGE_NOW': '3000000',
+}
+
+class PowerSuppliesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.root)
+
+  def write_supply(self, name, uevent):
+    path = os.path.join(self.root, name)
+    os.makedirs(path, exist_ok=True)
+    if isinstance(uevent, dict):
+      uevent = ''.join(key+'='+value+'\n' for key, value in uevent.items())
+    if isinstance(uevent, str):
+      uevent = uevent.encode()
+    with open(os.path.join(path, 'uevent'), 'wb') as f:
+      f.write(uevent)
+    return path
+
+  def test_energy_battery(self):
+    path = self.write_supply('BAT0', ENERGY_BATTERY)
+    props = power_supplies.read_power_supplies(self.root)[path]
+    self.assertEqual(props['NativePath'], 'BAT0')
+    self.assertEqual(props['Model'], 'Fake Battery')
+    self.assertEqual(props['Type'], power_supplies.UPOWER_TYPE_BATTERY)
+    self.assertEqual(props['State'], 2)
+    self.assertEqual(props['Percentage'], 40.0)
+    self.assertEqual(props['Energy'], 20.0)
+    self.assertEqual(props['EnergyRate'], 10.0)
+    self.assertEqual(props['TimeToEmpty'], 7200)
+    self.assertEqual(props['TimeToFull'], 0)
+
+  def test_charge_battery(self):
+    path = self.write_supply('BAT1', CHARGE_BATTERY)
+    props = power_supplies.read_power_supplies(self.root)[path]
+    self.assertEqual(props['State'], 1)
+    # Without CAPACITY, the percentage is calculated from the charge
+    self.assertEqual(props['Percentage'], 75.0)
+    self.assertEqual(props['TimeToFull'], 3600)
+    self.assertNotIn('Energy', props)
+    self.assertNotIn('EnergyRate', props)
+
+  def test_states(self):
+    for status, state in (('Full', 4), ('Not charging', 5), ('Empty', 3), ('Bogus', 0)):
+      props = power_supplies.get_power_supply_properties('BAT0',
+       dict(ENERGY_BATTERY, POWER_SUPPLY_STATUS=status))
+      self.assertEqual(props['State'], state)
+      self.assertEqual(props['TimeToEmpty'], 0)
+
+  def test_non_batteries_are_skipped(self):
+    self.write_supply('AC', {'POWER_SUPPLY_TYPE': 'Mains', 'POWER_SUPPLY_ONLINE': '1'})
+    self.write_supply('hidpp_battery_0', dict(ENERGY_BATTERY, POWER_SUPPLY_SCOPE='Device'))
+    self.write_supply('BAT1', dict(ENERGY_BATTERY, POWER_SUPPLY_PRESENT='0'))
+    self.assertEqual(power_supplies.read_power_supplies(self.root), {})
+
+  def test_add_and_remove(self):
+    bat0 = self.write_supply('BAT0', ENERGY_BATTERY)
+    self.assertEqual(list(power_supplies.read_power_supplies(self.root)), [bat0])
+    bat1 = self.write_supply('BAT1', CHARGE_BATTERY)
+    self.assertEqual(list(power_supplies.read_power_supplies(self.root)), [bat0, bat1])
+    shutil.rmtree(bat0)
+    self.assertEqual(list(power_supplies.read_power_supplies(self.root)), [bat1])
+
+  def test_changed_uevent_is_reread(self):
+    path = self.write_supply('BAT0', ENERGY_BATTERY)
+    self.write_supply('BAT0', dict(ENERGY_BATTERY, POWER_SUPPLY_CAPACITY='39',
+     POWER_SUPPLY_STATUS='Charging'))
+    props = power_supplies.read_power_supplies(self.root)[path]
+    self.assertEqual((props['State'], props['Percentage']), (1, 39.0))
+
+  def test_missing_uevent(self):
+    os.makedirs(os.path.join(self.root, 'BAT0'))
+    path = self.write_supply('BAT1', ENERGY_BATTERY)
+    self.assertEqual(list(power_supplies.read_power_supplies(self.root)), [path])
+
+  def test_malformed_uevent(self):
+    path = self.write_supply('BAT0', b'garbage\n=1\nPOWER_SUPPLY_TYPE=Battery\n'
+     b'POWER_SUPPLY_MODEL_NAME=\xff\xfe\nPOWER_SUPPLY_CAPACITY=abc\n'
+     b'POWER_SUPPLY_ENERGY_NOW=\nPOWER_SUPPLY_CHARGE_NOW=5\nPOWER_SUPPLY_CHARGE_FULL=0')
+    props = power_supplies.read_power_supplies(self.root)[path]
+    self.assertEqual(props['Model'], '\ufffd\ufffd')
+    self.assertEqual(props['State'], 0)
+    # Unparseable values are treated as missing, and a zero full charge does not divide by zero
+    self.assertEqual(props['Percentage'], 0.0)
+    self.assertNotIn('Energy', props)
+
+  def test_out_of_range_capacity(self):
+    props = power_supplies.get_power_supply_properties('BAT0',
+     dict(ENERGY_BATTERY, POWER_SUPPLY_CAPACITY='150'))
+    self.assertEqual(props['Percentage'], 100.0)
+
+  def test_empty_uevent(self):
+    self.write_supply('BAT0', b'')
+    self.assertEqual(power_supplies.read_power_supplies(self.root), {})
+
+  def test_missing_root(self):
+    with self.assertRaises(OSError):
+      power_supplies.read_power_supplies(os.path.join(self.root, 'missing'))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -17,9 +17,25 @@
 
 
 
+#
+# Usage: text_app.py [--stdin] [--fifo PATH] [--socket PATH] [--max-rate N]
+#  [--command COMMAND [--interval SECONDS] [--jitter SECONDS] [--timeout SECONDS]
+#  [--max-running N] [--max-backoff SECONDS]] [--] [text ...]
+# Displays `text`.  If the first argument does not start with `--`, all arguments are displayed as
+# text (so `text_app.py -5°C` works).  Otherwise, use `--` before text that starts with `-`, as in
+# `text_app.py --stdin -- -5°C` or `text_app.py -- --help`.
+# With --stdin, --fifo, or --socket, each line of text that is received replaces the displayed
+# text, so a script can update the icon without restarting this app.  For example:
+#  mkfifo /tmp/text ; text_app.py --fifo /tmp/text & echo 'Hello' > /tmp/text
+#  some_script | text_app.py --stdin
+#  echo 'Hello' | socat -u - UNIX-CONNECT:/tmp/text.sock  # With --socket /tmp/text.sock
+# With --command, the command is run (using /bin/sh) every `--interval` seconds, and the first line
+# of its output replaces the displayed text.  For example:
+#  text_app.py --command 'cut -d" " -f1 /proc/loadavg' --interval 5
 #
 # Prerequisites:
 # Install GtkTrayIcon (from the gtktrayicon/ subdirectory)
+# Keep tray_common.py in the same directory as this script
 # sudo apt-get install --no-install-recommends libgirepository1.0-dev gobject-introspection \
 #  gir1.2-gtk-3.0
 #
@@ -38,46 +54,248 @@ background_color = '#9A9A9A'
 
 import gi
 gi.require_version('Gtkti', '3.0')
-from gi.repository import Gtkti, Gtk, Gdk, GLib
-import signal, sys, os
-import threading
-
-# In Python 2, threading.Event().wait() wakes up frequently and burns a lot of CPU.
-# This does not happen in Python 3, so I'm simply using Python 3 instead of Python 2 for this app.
-# See: http://stackoverflow.com/questions/29082268/python-time-sleep-vs-event-wait
-# I don't know if there are any work-arounds for this issue in Python 2.
+from gi.repository import Gtkti, Gtk, Gdk, GLib, Gio
+import tray_common
+import sys, os
+import argparse
+import socket, stat
+import random, time
 
 # WARNING: Variable scope for Python inline functions and lambdas does not work like other
 # languages!  To ensure that definition-scope variables are passed into the function/lambda's scope
 # as expected, explicitly add 'var=var' (optional/defaulted) parameters to the end of the function/
 # lambda's parameter list.
 
+# Reads newline-delimited text from a file descriptor within the GTK main thread (without blocking
+# it), and calls `callback(line)` with the last complete line of each read.  When lines arrive in a
+# burst, the earlier lines in the same read have already been superseded, so they are skipped.
+# `on_eof()` is called (and the descriptor is no longer watched) when the writer closes its end.
+# Lines longer than `max_line_length` are skipped entirely (up to and including their newline).
+class LineReader:
+
+  max_line_length = 65536
+
+  def __init__(self, fd, callback, on_eof=None):
+    self.fd = fd
+    self.callback = callback
+    self.on_eof = on_eof
+    self.buffer = b''
+    self.discarding = False  # True while skipping the rest of an overlong line
+    self.lines = 0
+    self.skipped = 0
+    os.set_blocking(fd, False)
+    tray_common.watch_fd(fd, GLib.IOCondition.IN | GLib.IOCondition.HUP | GLib.IOCondition.ERR,
+     self.readable)
+
+  def readable(self, fd, condition):
+    try:
+      data = os.read(fd, 65536)
+    except BlockingIOError:
+      return True
+    except OSError:
+      data = b''
+    if not data:
+      if self.buffer:
+        self.lines += 1
+        self.callback(self.buffer.decode('utf-8', 'replace'))
+        self.buffer = b''
+      if self.on_eof:
+        self.on_eof()
+      # Return false to unregister this method as a GLib fd handler
+      return False
+    if self.discarding:
+      newline = data.find(b'\n')
+      if newline < 0:
+        return True
+      data = data[newline+1:]
+      self.discarding = False
+      self.lines += 1
+      self.skipped += 1
+    lines = (self.buffer + data).split(b'\n')
+    self.buffer = lines.pop()
+    if len(self.buffer) > self.max_line_length:
+      self.buffer = b''
+      self.discarding = True
+    if lines:
+      self.lines += len(lines)
+      self.skipped += len(lines) - 1
+      self.callback(lines[-1].decode('utf-8', 'replace'))
+    # Return true to keep this method registered as a GLib fd handler
+    return True
+
+# Runs a shell command every `interval` seconds (+/- up to `jitter` seconds, so that several pollers
+# started at the same time don't stay in lock step), and calls `callback(line)` with the first line
+# of the command's output whenever it changes.
+# The command runs asynchronously (as a Gio.Subprocess whose output is collected by the GLib main
+# loop), so a slow command never blocks the UI.  A run that takes longer than `timeout` seconds is
+# killed.  If `max_running` runs are still in progress when the next run is due, that run is
+# skipped.  While the command keeps failing (exiting with a non-zero status or timing out), the
+# interval is doubled after each failure, up to `max_backoff` seconds.  Runs are never started
+# less than `min_interval` seconds apart.  Output that is not valid UTF-8 is decoded with
+# replacement characters rather than treated as a failure.
+class CommandPoller:
+
+  min_interval = 0.1  # seconds
+
+  def __init__(self, name, command, callback, interval, jitter=0, timeout=None, max_running=1,
+   max_backoff=300):
+    self.command = command
+    self.callback = callback
+    self.interval = max(interval, self.min_interval)
+    self.jitter = jitter
+    self.timeout = timeout
+    self.max_running = max_running
+    self.max_backoff = max(self.interval, max_backoff)
+    self.output = None
+    self.failures = 0  # Consecutive failures
+    self.started = 0  # Sequence number of the most recently started run
+    self.applied = 0  # Sequence number of the run whose output was most recently used
+    self.running = 0
+    self.runs = 0
+    self.total_failures = 0
+    self.timeouts = 0
+    self.skipped = 0
+    self.changes = 0
+    self.duration_total = 0
+    self.duration_max = 0
+    self.duration_last = 0
+    tray_common.register_stats(name+'.command', self.get_stats)
+    GLib.idle_add(self.tick)
+
+  def tick(self):
+    if self.running < self.max_running:
+      self.run()
+    else:
+      self.skipped += 1
+    # Cap the exponent, since the float multiplication overflows after about 1000 failures (and the
+    # delay has long since reached max_backoff by then)
+    delay = min(self.interval * 2**min(self.failures, 30), self.max_backoff)
+    if self.jitter:
+      delay = max(self.min_interval, delay + random.uniform(-self.jitter, self.jitter))
+    GLib.timeout_add(int(delay*1000), self.tick)
+
+    # Return false to unregister this method as a GLib idle/timeout handler
+    return False
+
+  def run(self):
+    self.started += 1
+    seq = self.started
+    start = time.monotonic()
+    try:
+      process = Gio.Subprocess.new(['/bin/sh', '-c', self.command],
+       Gio.SubprocessFlags.STDOUT_PIPE)
+    except GLib.Error as e:
+      print('Unable to run command: '+e.message, file=sys.stderr)
+      self.failed()
+      return
+    self.running += 1
+    timer = None
+    timed_out = [False]
+    cancellable = Gio.Cancellable()
+    if self.timeout:
+      # Also stop waiting for output, in case the command started children that are still holding
+      # its stdout open
+      def kill(process=process, timed_out=timed_out, cancellable=cancellable):
+        timed_out[0] = True
+        process.force_exit()
+        cancellable.cancel()
+        return False
+      timer = GLib.timeout_add(int(self.timeout*1000), kill)
+    def done(process, result, self=self, seq=seq, start=start, timer=timer, timed_out=timed_out):
+      if timer and not timed_out[0]:
+        GLib.source_remove(timer)
+      self.running -= 1
+      self.runs += 1
+      duration = time.monotonic() - start
+      self.duration_last = duration
+      self.duration_total += duration
+      self.duration_max = max(self.duration_max, duration)
+      stdout = None
+      try:
+        _ok, stdout, _stderr = process.communicate_finish(result)
+      except GLib.Error as e:
+        if not timed_out[0]:
+          print('Error reading command output: '+e.message, file=sys.stderr)
+          self.failed()
+          return
+      if timed_out[0]:
+        self.timeouts += 1
+        print('Command timed out after '+str(self.timeout)+' seconds', file=sys.stderr)
+        self.failed()
+        return
+      if not process.get_successful():
+        print('Command failed with exit status '+str(process.get_exit_status()), file=sys.stderr)
+        self.failed()
+        return
+      self.failures = 0
+      # With concurrent runs, an older run may finish after a newer one
+      if seq < self.applied:
+        return
+      self.applied = seq
+      output = (stdout.get_data() if stdout else b'').decode('utf-8', 'replace').split('\n', 1)[0]
+      if output != self.output:
+        self.output = output
+        self.changes += 1
+        self.callback(output)
+    process.communicate_async(None, cancellable, done)
+
+  def failed(self):
+    self.failures += 1
+    self.total_failures += 1
+
+  def get_stats(self):
+    return {
+      'runs': self.runs,
+      'running': self.running,
+      'failures': self.total_failures,
+      'consecutive_failures': self.failures,
+      'timeouts': self.timeouts,
+      'skipped': self.skipped,
+      'output_changes': self.changes,
+      'duration_total': self.duration_total,
+      'duration_max': self.duration_max,
+      'duration_last': self.duration_last,
+    }
+
 class TextApp:
 
-  def __init__(self, text):
+  # If `max_rate` is set, the displayed text is updated at most `max_rate` times per second
+  # (otherwise, it is updated as soon as the main loop is idle).  Either way, if several updates
+  # arrive before the text is updated, only the latest is displayed.
+  def __init__(self, text, max_rate=None):
     self.text = text
 
+    self.input_lines = 0
+    self.input_skipped = 0
+    self.readers = []
+    tray_common.register_stats('TextApp.input', lambda self=self: {
+      'lines': self.input_lines + sum(r.lines for r in self.readers),
+      'skipped': self.input_skipped + sum(r.skipped for r in self.readers),
+      'readers': len(self.readers),
+    })
+
+    interval = 1.0 / max_rate if max_rate else 0
+    self.dispatcher = tray_common.UpdateDispatcher('TextApp', self.gtk_update_ui, interval,
+     interval or None)
+
     self.build_ui()
+    tray_common.mark_startup('TextApp', 'ui_built')
 
   def build_ui(self):
     self.tray = tray = Gtkti.TrayIcon()
     eventbox = Gtk.EventBox()
     if background_color:
-      css = Gtk.CssProvider()
-      css.load_from_data(('* { background-color: '+background_color+'; }').encode())
-      Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+      tray_common.set_background_color(background_color)
     tray.add(eventbox)
     self.tray_label = tray_label = Gtk.Label(label=self.text)
     eventbox.add(tray_label)
     tray.show_all()
+    self.renderer = tray_common.Renderer('TextApp', tray_label)
 
     menu = Gtk.Menu()
     item_quit = Gtk.MenuItem(label='Quit')
     def quit(menu_item):
-      if sys.version_info < (3, 0):
-        os.kill(os.getpid(), signal.SIGINT)
-      else:
-        Gtk.main_quit()
+      Gtk.main_quit()
     item_quit.connect('activate', quit)
     menu.append(item_quit)
     menu.show_all()
@@ -86,21 +304,120 @@ class TextApp:
         menu.popup(None, None, None, None, event.button, event.time)
     eventbox.connect('button-press-event', button_pressed)
 
+  # Set the displayed text (thread-safe)
+  def set_text(self, text):
+    if self.dispatcher.pending:
+      self.input_skipped += 1
+    self.text = text
+    self.update_ui()
+
+  # Update the UI (thread-safe)
+  def update_ui(self):
+    self.dispatcher.request()
+
+  # Update the UI (within the GTK main thread ; not thread-safe)
+  def gtk_update_ui(self):
+    self.renderer.render(self.text)
+
+    # Return false to unregister this method as a GLib idle handler
+    return False
+
+  def add_reader(self, fd, on_eof=None):
+    def eof(self=self, on_eof=on_eof):
+      self.retire_reader(reader)
+      if on_eof:
+        on_eof()
+    reader = LineReader(fd, self.set_text, eof)
+    self.readers.append(reader)
+    return reader
+
+  def retire_reader(self, reader):
+    # Keep the counts of readers that have closed
+    self.input_lines += reader.lines
+    self.input_skipped += reader.skipped
+    self.readers.remove(reader)
+
+  # Read lines from stdin.  When stdin is closed, the last line remains displayed.
+  def read_stdin(self):
+    self.add_reader(sys.stdin.fileno())
+
+  # Read lines from a named pipe, which is created if it doesn't exist.
+  def read_fifo(self, path):
+    if not os.path.exists(path):
+      os.mkfifo(path, 0o600)
+    fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    # Also hold the pipe open for writing, so that it never reports end-of-file (and never needs to
+    # be re-opened) when a writer closes it
+    self.fifo_write_fd = os.open(path, os.O_WRONLY)
+    self.add_reader(fd)
+
+  # Accept connections on a Unix socket, and read lines from each connection
+  def listen(self, path):
+    # Remove a socket left behind by a previous instance, but never anything else
+    try:
+      if not stat.S_ISSOCK(os.lstat(path).st_mode):
+        raise FileExistsError(path+' already exists and is not a socket')
+      os.unlink(path)
+    except FileNotFoundError:
+      pass
+    self.listen_socket = listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listen_socket.bind(path)
+    listen_socket.listen(8)
+    listen_socket.setblocking(False)
+    def accept(fd, condition, self=self, listen_socket=listen_socket):
+      try:
+        connection, _address = listen_socket.accept()
+      except BlockingIOError:
+        return True
+      self.add_reader(connection.fileno(), connection.close)
+      # Return true to keep this method registered as a GLib fd handler
+      return True
+    tray_common.watch_fd(listen_socket.fileno(), GLib.IOCondition.IN, accept)
+
+  # Display the output of a command that is run periodically (See CommandPoller)
+  def poll_command(self, command, interval, **kwargs):
+    self.poller = CommandPoller('TextApp', command, self.set_text, interval, **kwargs)
+
 if __name__ == '__main__':
-  TextApp(' '.join(sys.argv[1:]))
-
-  def on_sigint(_signum, _frame):
-    Gtk.main_quit()
-  signal.signal(signal.SIGINT, on_sigint)
-
-  # If the main thread is running C code (such as Gtk.main()), then Python signal handlers will not
-  # run until that C code returns.  To work around this, run the C code in a separate thread, then
-  # sleep the main thread.  Unfortunately, threading.Thread().join() and threading.Event().wait() in
-  # Python 2.X (but not 3.X) also block signal handlers (see http://bugs.python.org/issue1167930).
-  # To work around this, sleep the main thread using signal.pause(), and wake it from the 'Quit'
-  # menu item above using `os.kill(os.getpid(), signal.SIGINT)`.
-  thread = threading.Thread(target=Gtk.main)
-  thread.start()
-  if sys.version_info < (3, 0):
-    signal.pause()
-  thread.join()
+  parser = argparse.ArgumentParser(description='Display text in the system tray.',
+   epilog='Use -- before text that starts with -')
+  parser.add_argument('--stdin', action='store_true', help='Read lines of text from stdin')
+  parser.add_argument('--fifo', metavar='PATH', help='Read lines of text from a named pipe')
+  parser.add_argument('--socket', metavar='PATH', help='Read lines of text from a Unix socket')
+  parser.add_argument('--max-rate', type=float, metavar='N',
+   help='Update the displayed text at most N times per second')
+  parser.add_argument('--command', help='Display the output of a command that is run periodically')
+  def interval(value):
+    value = float(value)
+    if value < CommandPoller.min_interval:
+      raise argparse.ArgumentTypeError('must be at least '+str(CommandPoller.min_interval))
+    return value
+  parser.add_argument('--interval', type=interval, default=10, metavar='SECONDS',
+   help='Time between runs of the command (default: %(default)s)')
+  parser.add_argument('--jitter', type=float, default=0, metavar='SECONDS',
+   help='Randomly vary the time between runs by up to this much (default: %(default)s)')
+  parser.add_argument('--timeout', type=float, metavar='SECONDS',
+   help='Kill the command if it runs for longer than this')
+  parser.add_argument('--max-running', type=int, default=1, metavar='N',
+   help='Maximum number of concurrent runs of the command (default: %(default)s)')
+  parser.add_argument('--max-backoff', type=float, default=300, metavar='SECONDS',
+   help='Maximum time between runs while the command is failing (default: %(default)s)')
+  parser.add_argument('text', nargs='*')
+  argv = sys.argv[1:]
+  if argv and not argv[0].startswith('--'):
+    # `text_app.py <text>` displays <text> literally, even if it looks like an option (such as -5°C)
+    argv = ['--'] + argv
+  args = parser.parse_args(argv)
+
+  app = TextApp(' '.join(args.text), args.max_rate)
+  if args.stdin:
+    app.read_stdin()
+  if args.fifo:
+    app.read_fifo(args.fifo)
+  if args.socket:
+    app.listen(args.socket)
+  if args.command:
+    app.poll_command(args.command, args.interval, jitter=args.jitter, timeout=args.timeout,
+     max_running=args.max_running, max_backoff=args.max_backoff)
+
+  tray_common.run()
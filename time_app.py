@@ -20,6 +20,7 @@
 #
 # Prerequisites:
 # Install GtkTrayIcon (from the gtktrayicon/ subdirectory)
+# Keep tray_common.py in the same directory as this script
 # sudo apt-get install --no-install-recommends libgirepository1.0-dev gobject-introspection \
 #  gir1.2-gtk-3.0
 #
@@ -39,14 +40,126 @@ background_color = '#9A9A9A'
 import gi
 gi.require_version('Gtkti', '3.0')
 from gi.repository import Gtkti, Gtk, Gdk, GLib
-import signal, sys, os
-import threading
-import datetime
+import tray_common
+import datetime, time
+import zoneinfo
+import os, errno
+import ctypes, ctypes.util
 
-# In Python 2, threading.Event().wait() wakes up frequently and burns a lot of CPU.
-# This does not happen in Python 3, so I'm simply using Python 3 instead of Python 2 for this app.
-# See: http://stackoverflow.com/questions/29082268/python-time-sleep-vs-event-wait
-# I don't know if there are any work-arounds for this issue in Python 2.
+# timerfd (see `man timerfd_create`) is not exposed by the os module until Python 3.13
+CLOCK_REALTIME = 0
+TFD_NONBLOCK = 0o4000
+TFD_CLOEXEC = 0o2000000
+TFD_TIMER_ABSTIME = 1 << 0
+TFD_TIMER_CANCEL_ON_SET = 1 << 1
+class timespec(ctypes.Structure):
+  _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+class itimerspec(ctypes.Structure):
+  _fields_ = [('it_interval', timespec), ('it_value', timespec)]
+libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+libc.timerfd_create.argtypes = [ctypes.c_int, ctypes.c_int]
+libc.timerfd_settime.argtypes = \
+ [ctypes.c_int, ctypes.c_int, ctypes.POINTER(itimerspec), ctypes.POINTER(itimerspec)]
+
+# Calls `callback()` (within the GTK main thread) on every multiple of `period` seconds of the wall
+# clock, and immediately whenever the wall clock is stepped (by NTP, by the user, or by resuming
+# from suspend).
+# The timer is armed at an absolute CLOCK_REALTIME time, so it cannot fire before the boundary
+# (unlike a relative sleep computed from the current time, which can fire early or late if the
+# clock is adjusted while sleeping), and TFD_TIMER_CANCEL_ON_SET wakes it if the clock is stepped
+# before the boundary is reached.
+class WallClockTimer:
+
+  def __init__(self, name, callback, period):
+    self.callback = callback
+    self.fires = 0
+    self.clock_steps = 0
+    tray_common.register_stats(name+'.timer', lambda self=self: {
+      'fires': self.fires,
+      'clock_steps': self.clock_steps,
+      'period': self.period,
+    })
+    self.fd = libc.timerfd_create(CLOCK_REALTIME, TFD_NONBLOCK | TFD_CLOEXEC)
+    if self.fd < 0:
+      err = ctypes.get_errno()
+      raise OSError(err, os.strerror(err))
+    tray_common.watch_fd(self.fd, GLib.IOCondition.IN, self.fired)
+    self.set_period(period)
+
+  def set_period(self, period):
+    self.period = period
+    self.arm()
+
+  def arm(self):
+    spec = itimerspec()
+    spec.it_value.tv_sec = (int(time.time()) // self.period + 1) * self.period
+    flags = TFD_TIMER_ABSTIME | TFD_TIMER_CANCEL_ON_SET
+    if libc.timerfd_settime(self.fd, flags, ctypes.byref(spec), None) < 0:
+      err = ctypes.get_errno()
+      raise OSError(err, os.strerror(err))
+
+  def fired(self, fd, condition):
+    try:
+      os.read(self.fd, 8)
+    except OSError as e:
+      # ECANCELED indicates that the wall clock was stepped, which also disarms the timer
+      if e.errno == errno.EAGAIN:
+        return True
+      if e.errno != errno.ECANCELED:
+        raise
+      self.clock_steps += 1
+    self.fires += 1
+    self.callback()
+    self.arm()
+    # Return true to keep this method registered as a GLib fd handler
+    return True
+
+# A time zone whose UTC offset is cached until the zone's next transition (such as the start or end
+# of DST), so that displaying the time in several zones doesn't require a time zone lookup for each
+# zone on every tick.  The next transition is found when the offset is cached (stepping forward one
+# day at a time for up to a year, then bisecting to the second), so the cost of a lookup is only
+# paid once per transition (or when the wall clock is stepped outside of the cached range).
+class CachedZone:
+
+  def __init__(self, name):
+    self.name = name  # IANA time zone name (such as 'America/New_York'), or None for local time
+    self.tz = zoneinfo.ZoneInfo(name) if name else None
+    self.offset = 0  # seconds
+    self.valid_from = 0
+    self.valid_until = 0
+    self.lookups = 0
+
+  def offset_at(self, timestamp):
+    if self.tz is None:
+      return time.localtime(timestamp).tm_gmtoff
+    return int(datetime.datetime.fromtimestamp(timestamp, self.tz).utcoffset().total_seconds())
+
+  def get_offset(self, timestamp):
+    if not self.valid_from <= timestamp < self.valid_until:
+      self.update(timestamp)
+    return self.offset
+
+  def update(self, timestamp):
+    self.lookups += 1
+    self.offset = offset = self.offset_at(timestamp)
+    self.valid_from = timestamp
+    step = 86400
+    limit = timestamp + 366 * step
+    t = timestamp
+    while t < limit and self.offset_at(t + step) == offset:
+      t += step
+    if t >= limit:
+      self.valid_until = limit
+      return
+    # The offset changes somewhere in (t, t + step]
+    low, high = t, t + step
+    while high - low > 1:
+      mid = (low + high) // 2
+      if self.offset_at(mid) == offset:
+        low = mid
+      else:
+        high = mid
+    self.valid_until = high
 
 # WARNING: Variable scope for Python inline functions and lambdas does not work like other
 # languages!  To ensure that definition-scope variables are passed into the function/lambda's scope
@@ -65,111 +178,106 @@ class TimeApp:
     self.seconds_format = ':%S'
     self.suffix = ' '
 
-    self.time_fudge = datetime.timedelta(seconds=.25)
+    # Time zones to display, in order.  Each entry is (label, zone), where zone is an IANA time zone
+    # name, or `None` for the local time zone.  (%Z in the formats above would always show 'UTC', so
+    # use the label to identify each zone instead.)
+    zones = [
+      ('', None),
+      #('NY:', 'America/New_York'),
+      #('UTC:', 'UTC'),
+    ]
+    self.zone_separator = ' '
+    # Show each zone in its own tray icon, instead of showing all of them in one label
+    self.separate_icons = False
 
+    self.zones = [(label, CachedZone(name)) for label, name in zones]
+    tray_common.register_stats('TimeApp.zones', lambda self=self: {
+      'zones': len(self.zones),
+      'lookups': sum(zone.lookups for label, zone in self.zones),
+    })
+
+    self.compile_formats()
     self.build_ui()
     self.gtk_update_ui()
-    self.start_update_thread()
+    tray_common.mark_startup('TimeApp', 'ui_built')
+    self.timer = WallClockTimer('TimeApp', self.gtk_update_ui, 1 if self.show_seconds else 60)
 
   def build_ui(self):
-    self.tray = tray = Gtkti.TrayIcon()
-    eventbox = Gtk.EventBox()
     if background_color:
-      css = Gtk.CssProvider()
-      css.load_from_data(('* { background-color: '+background_color+'; }').encode())
-      Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
-    tray.add(eventbox)
-    self.tray_label = tray_label = Gtk.Label(label=self.prefix+self.suffix)
-    eventbox.add(tray_label)
-    tray.show_all()
+      tray_common.set_background_color(background_color)
+    self.trays = []
+    self.renderers = []
+    eventboxes = []
+    for i in range(len(self.zones) if self.separate_icons else 1):
+      tray = Gtkti.TrayIcon()
+      eventbox = Gtk.EventBox()
+      tray.add(eventbox)
+      tray_label = Gtk.Label(label=self.prefix+self.suffix)
+      eventbox.add(tray_label)
+      tray.show_all()
+      self.trays.append(tray)
+      self.renderers.append(tray_common.Renderer('TimeApp', tray_label))
+      eventboxes.append(eventbox)
+    self.tray = self.trays[0]
+    self.tray_label = self.renderers[0].label
+    self.renderer = self.renderers[0]
 
     menu = Gtk.Menu()
     item_show_date = Gtk.CheckMenuItem(label='Show Date')
     item_show_date.set_active(self.show_date)
     def toggle_date(item_show_date, self=self):
       self.show_date = item_show_date.get_active()
+      self.compile_formats()
       self.gtk_update_ui()
     item_show_date.connect('toggled', toggle_date)
     menu.append(item_show_date)
     item_show_seconds = Gtk.CheckMenuItem(label='Show Seconds')
     item_show_seconds.set_active(self.show_seconds)
-    self.toggle_seconds_event = threading.Event()
     def toggle_seconds(item_show_seconds, self=self):
       self.show_seconds = item_show_seconds.get_active()
-      # Wake the update thread, which will update the UI, then sleep again
-      self.toggle_seconds_event.set()
+      self.compile_formats()
+      self.gtk_update_ui()
+      self.timer.set_period(1 if self.show_seconds else 60)
     item_show_seconds.connect('toggled', toggle_seconds)
     menu.append(item_show_seconds)
     item_quit = Gtk.MenuItem(label='Quit')
     def quit(menu_item):
-      if sys.version_info < (3, 0):
-        os.kill(os.getpid(), signal.SIGINT)
-      else:
-        Gtk.main_quit()
+      Gtk.main_quit()
     item_quit.connect('activate', quit)
     menu.append(item_quit)
     menu.show_all()
     def button_pressed(eventbox, event, menu=menu):
       if event.type == Gdk.EventType.BUTTON_PRESS and event.button == 3:
         menu.popup(None, None, None, None, event.button, event.time)
-    eventbox.connect('button-press-event', button_pressed)
+    for eventbox in eventboxes:
+      eventbox.connect('button-press-event', button_pressed)
 
-  # Update the UI (thread-safe)
-  def update_ui(self):
-    GLib.idle_add(self.gtk_update_ui)
-
-  # Update the UI (within the GTK main thread ; not thread-safe)
-  def gtk_update_ui(self):
-    fmt = self.prefix
+  # Build the format string for each zone when the settings change, rather than on every tick
+  def compile_formats(self):
+    fmt = ''
     if self.show_date: fmt += self.date_format
     fmt += self.time_format
     if self.show_seconds: fmt += self.seconds_format
-    fmt += self.suffix
-
-    # Update events should fire as close as possible to the second or minute boundary, but if they
-    # fire early, the previous time will incorrectly be displayed until the next update.  Fudge the
-    # time to make sure the display is incremented even if the event fires slightly early.
-    now = datetime.datetime.now() + self.time_fudge
+    # strftime() interprets '%', so escape it in the labels
+    self.zone_formats = [(label.replace('%', '%%')+fmt, zone) for label, zone in self.zones]
 
-    self.tray_label.set_text(now.strftime(fmt))
+  # Update the UI (within the GTK main thread ; not thread-safe)
+  # Every update comes from the timer or the menu, both of which run within the GTK main thread, so
+  # there are no requests to coalesce and no UpdateDispatcher is needed.
+  def gtk_update_ui(self):
+    now = int(time.time())
+    zone_strs = [time.strftime(fmt, time.gmtime(now + zone.get_offset(now)))
+     for fmt, zone in self.zone_formats]
+    if self.separate_icons:
+      for renderer, zone_str in zip(self.renderers, zone_strs):
+        renderer.render(self.prefix+zone_str+self.suffix)
+    else:
+      self.renderer.render(self.prefix+self.zone_separator.join(zone_strs)+self.suffix)
 
     # Return false to unregister this method as a GLib idle handler
     return False
 
-  def start_update_thread(self):
-    def run_in_thread(self=self):
-      while True:
-        fired_update = datetime.datetime.utcnow()
-        self.update_ui()
-        now = datetime.datetime.utcnow()
-        if self.show_seconds:
-          time_to_next_update = 1 - now.microsecond/1000000.0
-          if (1000000.0 - fired_update.microsecond) < self.time_fudge.microseconds:
-            time_to_next_update += 1
-        else:
-          time_to_next_update = 60 - now.second - now.microsecond/1000000.0
-          if time_to_next_update < 1 and (1000000.0 - fired_update.microsecond) < self.time_fudge.microseconds:
-            time_to_next_update += 60
-        self.toggle_seconds_event.wait(time_to_next_update) ; self.toggle_seconds_event.clear()
-    thread = threading.Thread(target=run_in_thread)
-    thread.daemon = True
-    thread.start()
-
 if __name__ == '__main__':
   TimeApp()
 
-  def on_sigint(_signum, _frame):
-    Gtk.main_quit()
-  signal.signal(signal.SIGINT, on_sigint)
-
-  # If the main thread is running C code (such as Gtk.main()), then Python signal handlers will not
-  # run until that C code returns.  To work around this, run the C code in a separate thread, then
-  # sleep the main thread.  Unfortunately, threading.Thread().join() and threading.Event().wait() in
-  # Python 2.X (but not 3.X) also block signal handlers (see http://bugs.python.org/issue1167930).
-  # To work around this, sleep the main thread using signal.pause(), and wake it from the 'Quit'
-  # menu item above using `os.kill(os.getpid(), signal.SIGINT)`.
-  thread = threading.Thread(target=Gtk.main)
-  thread.start()
-  if sys.version_info < (3, 0):
-    signal.pause()
-  thread.join()
+  tray_common.run()
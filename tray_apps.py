@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+#
+# Copyright 2026 Paul Donohue <Tray_Apps@PaulSD.com>
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.  If
+# not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Runs several of the Python tray apps in this directory within a single process, so that they
+# share one copy of the GTK runtime, one CSS provider, one system D-Bus connection, and one main
+# loop.  Each app still gets its own tray icon.
+#
+# Usage: tray_apps.py [app ...]
+# If app names are listed on the command line, only those apps are run, in the listed order.
+# Otherwise, all apps that are enabled in `apps` below are run.
+#
+# Prerequisites:
+# Install the prerequisites of each enabled app (see the comments at the top of each app's script)
+# Keep this script in the same directory as the app scripts
+#
+# To compare memory usage against running each app in its own process:
+# ps -o rss=,args= -C python3
+#
+
+# Overrides the `background_color` setting in each app's script.
+# Use `None` for a transparent background.  (See the comments in the app scripts.)
+#background_color = None
+background_color = '#9A9A9A'
+
+# Apps to run, in the order in which their icons should be created.  (Most tray managers position
+# icons in creation order.)  Each entry is (name, enabled, module, class, constructor arguments).
+apps = [
+  ('text', False, 'text_app', 'TextApp', ['Text']),
+  ('time', True, 'time_app', 'TimeApp', []),
+  ('battery', True, 'battery_app', 'BatteryApp', []),
+  ('volume', True, 'volume_app', 'VolumeApp', []),
+  ('wlan', True, 'wlan_app', 'WlanApp', []),
+  ('sysload', False, 'sysload_app', 'SysLoadApp', []),
+]
+
+
+
+import gi
+gi.require_version('Gtkti', '3.0')
+import tray_common
+import sys
+import importlib
+
+class TrayApps:
+
+  def __init__(self, names=None):
+    if names:
+      by_name = dict((app[0], app) for app in apps)
+      for name in names:
+        if name not in by_name:
+          raise ValueError('Unknown app: '+name)
+      selected = [by_name[name] for name in names]
+    else:
+      selected = [app for app in apps if app[1]]
+
+    self.apps = []
+    for name, _enabled, module_name, class_name, args in selected:
+      # Import each app only if it is enabled, so that disabled apps' prerequisites are not needed
+      module = importlib.import_module(module_name)
+      module.background_color = background_color
+      # Apps that use D-Bus share tray_common.get_system_bus(), which connects lazily after the
+      # first paint
+      self.apps.append(getattr(module, class_name)(*args))
+
+if __name__ == '__main__':
+  TrayApps(sys.argv[1:])
+
+  tray_common.run()
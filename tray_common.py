@@ -0,0 +1,403 @@
+#
+# Copyright 2026 Paul Donohue <Tray_Apps@PaulSD.com>
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program.  If
+# not, see <http://www.gnu.org/licenses/>.
+#
+
+
+
+#
+# Helpers shared by the Python tray apps in this directory.
+# This file must be kept in the same directory as the apps that use it.
+#
+
+import gi
+# Pin the GTK version before loading it, since this may be imported before any app imports Gtkti
+# (which requires GTK 3).  Otherwise, PyGObject loads the newest GTK that is installed.
+gi.require_version('Gtk', '3.0')
+gi.require_version('Gdk', '3.0')
+from gi.repository import Gtk, Gdk, GLib
+import signal, sys, os
+import json
+import socket, stat, tempfile
+import threading, time
+
+# Gtk.StyleContext.add_provider_for_screen() applies a provider to every widget on the screen, so
+# when several apps run in one process (see tray_apps.py), only one provider is needed per color.
+css_providers = {}
+def set_background_color(color):
+  if color in css_providers:
+    return
+  css = Gtk.CssProvider()
+  css.load_from_data(('* { background-color: '+color+'; }').encode())
+  Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+  css_providers[color] = css
+
+# Watch a file descriptor from the GLib main loop, and call `callback(fd, condition)` within the GTK
+# main thread whenever any of the `condition` events occur on it.  `condition` may be a
+# GLib.IOCondition or select.POLL* flags (which have the same values).  `callback` must return true
+# to keep watching.  Returns the GLib source ID.
+# Every app uses this for every descriptor it watches (instead of a mix of GLib.io_add_watch() and
+# GLib.unix_fd_add_full()), so descriptors are always passed as plain integers, and Python file
+# objects never need to be kept alive just for the sake of a watch.
+def watch_fd(fd, condition, callback, priority=GLib.PRIORITY_DEFAULT):
+  return GLib.unix_fd_add_full(priority, fd, GLib.IOCondition(condition), callback)
+
+# Statistics (see register_stats) are served as a JSON snapshot to every client that connects to a
+# Unix socket in this directory, so that a monitoring agent can collect them from every tray app
+# process on the host without attaching a debugger.  Each process creates `<script>.<pid>.sock`.
+# For example:  for s in $XDG_RUNTIME_DIR/tray_apps/*.sock ; do socat -u UNIX-CONNECT:$s - ; done
+# If $XDG_RUNTIME_DIR is not set, a private directory in /tmp is used instead.  The directory is
+# not used unless it is owned by the current user and is not writable by anyone else.
+# Use `None` to disable the socket.
+#stats_socket_dir = None
+if os.environ.get('XDG_RUNTIME_DIR'):
+  stats_socket_dir = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'tray_apps')
+else:
+  stats_socket_dir = os.path.join(tempfile.gettempdir(), 'tray_apps-'+str(os.getuid()))
+
+# Run the GTK main loop in the main thread until Gtk.main_quit() is called or SIGINT/SIGTERM is
+# received.
+# Python signal handlers installed with signal.signal() do not run while the main thread is running
+# C code (such as Gtk.main()).  GLib.unix_signal_add() instead dispatches the signal from within
+# the main loop, so Gtk.main() can run in the main thread and all work (D-Bus signals, timers, file
+# descriptor watches, and UI updates) can be scheduled on the default GLib main context without
+# any helper threads.
+def run():
+  for signum in (signal.SIGINT, signal.SIGTERM):
+    GLib.unix_signal_add(GLib.PRIORITY_HIGH, signum, on_quit_signal)
+  GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, on_stats_signal)
+  server = None
+  if stats_socket_dir:
+    try:
+      server = StatsServer(stats_socket_dir)
+    except OSError as e:
+      print('Unable to serve statistics in '+stats_socket_dir+': '+str(e), file=sys.stderr)
+  mark_startup('main', 'main_loop')
+  try:
+    Gtk.main()
+  finally:
+    for cleanup in cleanups:
+      cleanup()
+    if server:
+      server.close()
+
+def on_quit_signal():
+  Gtk.main_quit()
+  return True
+
+# `kill -USR1 <pid>` prints the statistics of every app in the process to stderr
+def on_stats_signal():
+  print(json.dumps(get_stats(), indent=2, sort_keys=True), file=sys.stderr)
+  return True
+
+# Functions that return a dict of statistics, keyed by name
+stats_sources = {}
+
+# Register a function that returns a dict of statistics.  If `name` is already in use (for example,
+# if several instances of the same app are running in one process), a unique suffix is appended.
+# Returns the name that was used.
+def register_stats(name, get_stats):
+  unique_name = name
+  i = 1
+  while unique_name in stats_sources:
+    i += 1
+    unique_name = name+'#'+str(i)
+  stats_sources[unique_name] = get_stats
+  return unique_name
+
+def get_stats():
+  return dict((name, get_stats()) for name, get_stats in stats_sources.items())
+
+# The system D-Bus connection shared by every app in the process
+# The connection is made the first time it is needed (after the apps' placeholder labels have been
+# painted), since connecting can be slow at login.
+system_bus = None
+def get_system_bus():
+  global system_bus
+  if not system_bus:
+    from pydbus import SystemBus
+    system_bus = SystemBus()
+  return system_bus
+
+# Functions that are called when the main loop exits (for example, to reap child processes)
+cleanups = []
+
+def register_cleanup(cleanup):
+  cleanups.append(cleanup)
+
+start_time = time.time()
+
+# Startup phase timing, in seconds since the process was started (not since this module was
+# imported, so that interpreter startup and imports are included).  Each phase is recorded only the
+# first time it is reached, and is included in the statistics as 'startup'.
+def get_process_start():
+  try:
+    with open('/proc/self/stat') as f:
+      stat = f.read()
+    # Field 22 (starttime) is in clock ticks since boot.  The process name (field 2) may contain
+    # spaces, so count from the closing parenthesis.
+    start_ticks = int(stat.rpartition(')')[2].split()[19])
+    age = time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf('SC_CLK_TCK')
+  except (OSError, ValueError, IndexError, AttributeError):
+    age = 0
+  return time.monotonic() - age
+process_start = get_process_start()
+startup_phases = {}
+def mark_startup(name, phase):
+  key = name+'.'+phase
+  if key not in startup_phases:
+    startup_phases[key] = time.monotonic() - process_start
+register_stats('startup', lambda: dict(startup_phases))
+
+# Serves a snapshot of get_stats() (See stats_socket_dir)
+class StatsServer:
+
+  def __init__(self, directory):
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    self.check_directory(directory)
+    self.remove_stale_sockets(directory)
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or 'python'
+    self.path = os.path.join(directory, script+'.'+str(os.getpid())+'.sock')
+    self.connections = 0
+    self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_NONBLOCK)
+    try:
+      os.unlink(self.path)
+    except FileNotFoundError:
+      pass
+    self.socket.bind(self.path)
+    self.socket.listen(8)
+    self.source = watch_fd(self.socket.fileno(), GLib.IOCondition.IN, self.accept,
+     GLib.PRIORITY_LOW)
+    register_stats('stats_server', lambda self=self: {'connections': self.connections})
+
+  # The directory may be in a world-writable location (and may have been created by someone else),
+  # so refuse to use it unless it is a real directory that only the current user can write to
+  def check_directory(self, directory):
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode):
+      raise PermissionError(directory+' is not a directory')
+    if st.st_uid != os.getuid():
+      raise PermissionError(directory+' is not owned by uid '+str(os.getuid()))
+    if st.st_mode & 0o022:
+      raise PermissionError(directory+' is writable by other users')
+
+  # Remove sockets left behind by processes that did not exit cleanly
+  def remove_stale_sockets(self, directory):
+    for name in os.listdir(directory):
+      parts = name.split('.')
+      if len(parts) < 3 or parts[-1] != 'sock' or not parts[-2].isdigit():
+        continue
+      try:
+        os.kill(int(parts[-2]), 0)
+      except ProcessLookupError:
+        try:
+          os.unlink(os.path.join(directory, name))
+        except OSError:
+          pass
+      except PermissionError:
+        pass
+
+  def accept(self, fd, condition):
+    try:
+      connection, _address = self.socket.accept()
+    except BlockingIOError:
+      return True
+    self.connections += 1
+    snapshot = {
+      'pid': os.getpid(),
+      'argv': sys.argv,
+      'time': time.time(),
+      'uptime': time.time() - start_time,
+      'stats': get_stats(),
+    }
+    # The snapshot is small enough to fit in the socket buffer, so this doesn't block the main loop
+    # unless the client is misbehaving, in which case the snapshot is dropped
+    connection.setblocking(False)
+    try:
+      connection.sendall((json.dumps(snapshot, sort_keys=True)+'\n').encode())
+    except OSError:
+      pass
+    connection.close()
+    # Return true to keep this method registered as a GLib fd handler
+    return True
+
+  def close(self):
+    GLib.source_remove(self.source)
+    self.socket.close()
+    try:
+      os.unlink(self.path)
+    except FileNotFoundError:
+      pass
+
+# Commits text to a label (and optionally tooltip text to another widget) only when the text has
+# changed.  Every Gtk.Label.set_text() or Gtk.Widget.set_tooltip_text() call queues a resize and
+# redraw of the tray icon, even if the text is unchanged, and a resize may cause the tray manager to
+# re-layout every docked icon.
+class Renderer:
+
+  def __init__(self, name, label, tooltip_widget=None):
+    self.name = name
+    self.label = label
+    self.tooltip_widget = tooltip_widget
+    self.text = label.get_text()
+    self.tooltip = tooltip_widget.get_tooltip_text() if tooltip_widget else None
+    self.renders = 0
+    self.label_commits = 0
+    self.tooltip_commits = 0
+    self.suppressed = 0
+    self.render_time_total = 0
+    register_stats(name+'.render', self.get_stats)
+    self.painted = False
+    self.paint_callbacks = []
+    self.paint_timeout = None
+    self.draw_handler = label.connect('draw', self.first_paint)
+
+  # `tooltip` is ignored if it is None or if there is no `tooltip_widget`
+  # Returns true if anything was committed to GTK
+  def render(self, text, tooltip=None):
+    start = time.monotonic()
+    self.renders += 1
+    committed = False
+    if text != self.text:
+      self.text = text
+      self.label.set_text(text)
+      self.label_commits += 1
+      committed = True
+    if tooltip is not None and self.tooltip_widget and tooltip != self.tooltip:
+      self.tooltip = tooltip
+      self.tooltip_widget.set_tooltip_text(tooltip)
+      self.tooltip_commits += 1
+      committed = True
+    if not committed:
+      self.suppressed += 1
+    self.render_time_total += time.monotonic() - start
+    return committed
+
+  def first_paint(self, label, cr):
+    label.disconnect(self.draw_handler)
+    self.painted = True
+    mark_startup(self.name, 'first_paint')
+    if self.paint_callbacks:
+      # Let the paint be flushed to the display before running anything slow
+      GLib.idle_add(self.run_paint_callbacks)
+    return False
+
+  # Call `callback()` (within the GTK main thread) once the label has been painted for the first
+  # time, so that slow startup work (such as importing backend modules and connecting to backends)
+  # doesn't delay the first paint of the tray icon.  If the label has not been painted within
+  # `timeout` seconds (for example, if no tray manager is running yet), `callback()` is called
+  # anyway.
+  def after_first_paint(self, callback, timeout=2):
+    self.paint_callbacks.append(callback)
+    if self.painted:
+      GLib.idle_add(self.run_paint_callbacks)
+    elif not self.paint_timeout:
+      def timed_out(self=self):
+        self.paint_timeout = None
+        self.run_paint_callbacks()
+        return False
+      self.paint_timeout = GLib.timeout_add(int(timeout*1000), timed_out)
+
+  def run_paint_callbacks(self):
+    if self.paint_timeout:
+      GLib.source_remove(self.paint_timeout)
+      self.paint_timeout = None
+    callbacks = self.paint_callbacks
+    self.paint_callbacks = []
+    for callback in callbacks:
+      callback()
+
+    # Return false to unregister this method as a GLib idle handler
+    return False
+
+  def get_stats(self):
+    return {
+      'renders': self.renders,
+      'render_time_total': self.render_time_total,
+      'label_commits': self.label_commits,
+      'tooltip_commits': self.tooltip_commits,
+      'suppressed': self.suppressed,
+    }
+
+# Coalesces requests to run `callback` (typically an app's gtk_update_ui()) so that at most one run
+# is pending at a time.  Requests may be made from any thread, and `callback` runs within the GTK
+# main thread.
+# If `min_interval` is 0, a pending run happens as soon as the main loop is idle, so all requests
+# that arrive before then are merged into one run.  Otherwise, a pending run is delayed until no
+# requests have arrived for `min_interval` seconds, so a burst of events results in a single run
+# after the burst settles.  If `max_latency` is not None, a pending run is never delayed more than
+# `max_latency` seconds after the first request that it serves.
+class UpdateDispatcher:
+
+  def __init__(self, name, callback, min_interval=0, max_latency=None):
+    self.callback = callback
+    self.min_interval = min_interval
+    self.max_latency = max_latency
+    self.lock = threading.Lock()
+    self.pending = False
+    self.first_request = 0
+    self.last_request = 0
+    self.requests = 0
+    self.merged = 0
+    self.runs = 0
+    self.run_time_total = 0
+    self.run_time_max = 0
+    register_stats(name+'.update', self.get_stats)
+
+  def request(self):
+    now = time.monotonic()
+    with self.lock:
+      self.requests += 1
+      self.last_request = now
+      if self.pending:
+        self.merged += 1
+        return
+      self.pending = True
+      self.first_request = now
+    if self.min_interval:
+      GLib.timeout_add(int(self.min_interval*1000), self.run)
+    else:
+      GLib.idle_add(self.run)
+
+  def run(self):
+    with self.lock:
+      deadline = self.last_request + self.min_interval
+      if self.max_latency is not None:
+        deadline = min(deadline, self.first_request + self.max_latency)
+      delay = deadline - time.monotonic()
+      if delay > 0.001:
+        # More requests arrived since this source was scheduled, so wait for them to settle
+        GLib.timeout_add(max(1, int(delay*1000)), self.run)
+        return False
+      self.pending = False
+      self.runs += 1
+    start = time.monotonic()
+    self.callback()
+    run_time = time.monotonic() - start
+    with self.lock:
+      self.run_time_total += run_time
+      self.run_time_max = max(self.run_time_max, run_time)
+
+    # Return false to unregister this method as a GLib idle/timeout handler
+    return False
+
+  def get_stats(self):
+    with self.lock:
+      return {
+        'requests': self.requests,
+        'merged': self.merged,
+        'runs': self.runs,
+        'pending': int(self.pending),
+        'run_time_total': self.run_time_total,
+        'run_time_max': self.run_time_max,
+      }
@@ -20,13 +20,15 @@
 #
 # Prerequisites:
 # Install GtkTrayIcon (from the gtktrayicon/ subdirectory)
+# Keep tray_common.py in the same directory as this script
 # sudo apt-get install --no-install-recommends libgirepository1.0-dev gobject-introspection \
 #  gir1.2-gtk-3.0
 # git clone https://github.com/larsimmisch/pyalsaaudio.git
 # cd pyalsaaudio ; python3 setup.py build ; sudo python3 setup.py install
 # (See https://bugs.debian.org/cgi-bin/bugreport.cgi?bug=613091 )
-#
-# TODO: Switch to https://pypi.org/project/pulsectl/
+# Keep mixers.py in the same directory as this script
+# Or, to use PulseAudio or PipeWire instead of ALSA (see `self.controls` below):
+# sudo apt-get install python3-pulsectl pulseaudio-utils
 
 # Use `None` for a transparent background.
 # In Ubuntu 18.04 (trayer 1.1.7, gtk 3.22.30), transparency worked fine.  However, in Ubuntu 20.04
@@ -43,10 +45,8 @@ background_color = '#9A9A9A'
 import gi
 gi.require_version('Gtkti', '3.0')
 from gi.repository import Gtkti, Gtk, Gdk, GLib
-import signal, sys, os
-import threading
-import alsaaudio  # See /usr/share/doc/python-alsaaudio/examples/mixertest.py
-import select
+import tray_common
+import mixers
 
 # WARNING: Variable scope for Python inline functions and lambdas does not work like other
 # languages!  To ensure that definition-scope variables are passed into the function/lambda's scope
@@ -56,81 +56,103 @@ import select
 class VolumeApp:
 
   def __init__(self):
-    self.prefix = 'V:'
+    self.prefix = ''
+    self.separator = ' '
     self.suffix = ' '
 
-    alsa_device = 'default'
-    alsa_control = 'Master'
-    self.alsa_ctl = alsaaudio.Mixer(control=alsa_control, device=alsa_device)
+    # Controls to display, in order.  Each entry is (label, backend, backend options), where backend
+    # is 'alsa' (See mixers.AlsaMixer) or 'pulse' (PulseAudio, or PipeWire via pipewire-pulse ; See
+    # mixers.PulseMixer).  The first control is the one that is adjusted by scrolling and by the
+    # popup window.  (`aplay -l` and `amixer -c <card> scontrols` list the available ALSA controls.)
+    self.controls = [
+      ('V:', 'alsa', {'device': 'default', 'control': 'Master'}),
+      #('H:', 'alsa', {'device': 'hw:1', 'control': 'Headphone'}),
+      #('D:', 'alsa', {'device': 'hw:2', 'control': 'IEC958'}),
+      #('C:', 'alsa', {'device': 'default', 'control': 'Capture', 'capture': True}),
+      #('P:', 'pulse', {'sink': None}),  # `None` for the default sink
+    ]
+    self.mixer_labels = [label for label, backend, options in self.controls]
+    self.mixers = []  # Opened after the first paint (See open_mixers())
+    self.mixer = None
 
     self.scroll_step = 4  # Amount to change volume for each scroll event
+    # Minimum time between mixer writes while dragging the popup slider, `None` to write at most
+    # once per display frame, or 0 to write on every change.  (Mixer writes can be slow on USB audio
+    # devices.)
+    self.slider_write_interval = None  # seconds
+
+    # Volume changes are interactive, so don't delay updates, but merge any that arrive before the
+    # main loop is idle.  (See tray_common.UpdateDispatcher)
+    self.update_min_interval = 0  # seconds
+    self.update_max_latency = None  # seconds
+    self.dispatcher = tray_common.UpdateDispatcher('VolumeApp', self.gtk_update_ui,
+     self.update_min_interval, self.update_max_latency)
 
     self.build_ui()
+    tray_common.mark_startup('VolumeApp', 'ui_built')
+    # Opening the mixers requires importing the backend modules (and may require connecting to a
+    # sound server), so show the placeholder label first
+    self.renderer.after_first_paint(self.open_mixers)
+
+  def open_mixers(self):
+    for label, backend, options in self.controls:
+      if backend == 'pulse':
+        mixer = mixers.PulseMixer(**options)
+      else:
+        mixer = mixers.AlsaMixer(**options)
+      tray_common.register_stats('VolumeApp.mixer', mixer.get_stats)
+      self.mixers.append(mixer)
+    self.mixer = self.mixers[0]
     self.gtk_update_ui()
-    self.start_monitor_thread()
+    self.start_monitor()
+    tray_common.register_cleanup(self.close_mixers)
+    tray_common.mark_startup('VolumeApp', 'backend_connected')
+
+  def close_mixers(self):
+    for mixer in self.mixers:
+      mixer.close()
 
   def build_ui(self):
     self.tray = tray = Gtkti.TrayIcon()
     eventbox = Gtk.EventBox()
     if background_color:
-      css = Gtk.CssProvider()
-      css.load_from_data(('* { background-color: '+background_color+'; }').encode())
-      Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+      tray_common.set_background_color(background_color)
     tray.add(eventbox)
-    self.tray_label = tray_label = Gtk.Label(label=self.prefix+self.suffix)
+    self.tray_label = tray_label = Gtk.Label(
+     label=self.prefix+self.separator.join(label+'?' for label in self.mixer_labels)+self.suffix)
     eventbox.add(tray_label)
     tray.show_all()
+    self.renderer = tray_common.Renderer('VolumeApp', tray_label)
 
     menu = Gtk.Menu()
     item_quit = Gtk.MenuItem(label='Quit')
     def quit(menu_item):
-      if sys.version_info < (3, 0):
-        os.kill(os.getpid(), signal.SIGINT)
-      else:
-        Gtk.main_quit()
+      Gtk.main_quit()
     item_quit.connect('activate', quit)
     menu.append(item_quit)
     menu.show_all()
     def show_menu(event, menu=menu):
       menu.popup(None, None, None, None, event.button, event.time)
 
-    window = Gtk.Window(type=Gtk.WindowType.POPUP)
-    box = Gtk.VBox()
-    window.add(box)
-    slider = Gtk.VScale()
-    slider.set_size_request(0,200)
-    slider.set_range(0,100)
-    slider.set_inverted(True)
-    slider.set_draw_value(False)
-    def slider_changed(slider):
-      self.alsa_ctl.setvolume(int(slider.get_value()))
-      self.gtk_update_ui(True)
-    slider.connect('value-changed', slider_changed)
-    box.add(slider)
-    button = Gtk.Button.new_with_label('M')
-    def button_clicked(button):
-      if self.alsa_ctl.getmute()[0]:
-        self.alsa_ctl.setmute(0)
-        button.set_label('m')
-      else:
-        self.alsa_ctl.setmute(1)
-        button.set_label('M')
-      self.gtk_update_ui(True)
-    button.connect('clicked', button_clicked)
-    box.add(button)
+    # The popup window is built the first time it is shown (See build_window())
+    self.window = None
     self.window_visible = False
-    def update_window(self=self, slider=slider, button=button):
-      if self.window_visible:
-        slider.set_value(self.alsa_ctl.getvolume()[0])
-        if self.alsa_ctl.getmute()[0]:
-          button.set_label('M')
-        else:
-          button.set_label('m')
-    self.update_window = update_window
-    # Need to render the window briefly so that window.get_size() will be accurate
-    window.show_all()
-    window.hide()
-    def toggle_window(self=self, window=window):
+    self.slider_pending = False
+    self.slider_drags = 0
+    self.slider_drag_writes = 0
+    self.slider_drag_writes_max = 0
+    self.slider_drag_start_writes = 0
+    tray_common.register_stats('VolumeApp.slider', lambda self=self: {
+      'drags': self.slider_drags,
+      'writes': self.slider_drag_writes,
+      'writes_per_drag_max': self.slider_drag_writes_max,
+    })
+    def toggle_window(self=self):
+      if not self.mixer:
+        return
+      if not self.window:
+        self.build_window()
+      window = self.window
       if self.window_visible:
         window.hide()
         self.window_visible = False
@@ -147,7 +169,8 @@ class VolumeApp:
           window.move(tray_x, tray_y+tray_height)
         else:
           # Put window above tray
-          window_height = window.get_size()[1]
+          # (The preferred size is available before the window has been realized)
+          window_height = window.get_preferred_size()[1].height
           window.move(tray_x, tray_y-window_height)
         self.window_visible = True
         self.update_window()
@@ -160,38 +183,115 @@ class VolumeApp:
         toggle_window()
     eventbox.connect('button-press-event', button_pressed)
 
-    def scrolled(eventbox, event):
-      if event.direction == Gdk.ScrollDirection.UP:
-        if self.alsa_ctl.getmute()[0]:
-          self.alsa_ctl.setmute(0)
-          self.alsa_ctl.setvolume(self.scroll_step)
+    # High resolution touchpads send smooth scroll events at up to the display frame rate, so
+    # accumulate scroll deltas and apply them at most once per frame
+    self.scroll_delta = 0
+    self.scroll_pending = False
+    def apply_scroll(eventbox, frame_clock, self=self):
+      self.scroll_pending = False
+      delta = int(self.scroll_delta)
+      self.scroll_delta -= delta  # Keep any fractional remainder for the next frame
+      if delta > 0:
+        if self.mixer.muted:
+          self.mixer.set_mute(False)
+          self.mixer.set_volume(delta)
         else:
-          cur_vol = self.alsa_ctl.getvolume()[0]
-          if cur_vol > (100-self.scroll_step):
-            self.alsa_ctl.setvolume(100)
-          else:
-            self.alsa_ctl.setvolume(cur_vol+self.scroll_step)
-      elif event.direction == Gdk.ScrollDirection.DOWN:
-        cur_vol = self.alsa_ctl.getvolume()[0]
-        if cur_vol < self.scroll_step:
-          self.alsa_ctl.setvolume(0)
-          self.alsa_ctl.setmute(1)
+          self.mixer.set_volume(self.mixer.volume+delta)
+      elif delta < 0:
+        if self.mixer.volume+delta < 0:
+          self.mixer.set_volume(0)
+          self.mixer.set_mute(True)
         else:
-          self.alsa_ctl.setvolume(cur_vol-self.scroll_step)
+          self.mixer.set_volume(self.mixer.volume+delta)
       self.gtk_update_ui()
+      return GLib.SOURCE_REMOVE
+    def scrolled(eventbox, event):
+      if not self.mixer:
+        return
+      if event.direction == Gdk.ScrollDirection.UP:
+        self.scroll_delta += self.scroll_step
+      elif event.direction == Gdk.ScrollDirection.DOWN:
+        self.scroll_delta -= self.scroll_step
+      elif event.direction == Gdk.ScrollDirection.SMOOTH:
+        self.scroll_delta -= event.get_scroll_deltas()[2] * self.scroll_step
+      else:
+        return
+      if not self.scroll_pending:
+        self.scroll_pending = True
+        eventbox.add_tick_callback(apply_scroll)
+    eventbox.add_events(Gdk.EventMask.SCROLL_MASK | Gdk.EventMask.SMOOTH_SCROLL_MASK)
     eventbox.connect('scroll-event', scrolled)
 
+  def build_window(self):
+    window = Gtk.Window(type=Gtk.WindowType.POPUP)
+    box = Gtk.VBox()
+    window.add(box)
+    slider = Gtk.VScale()
+    slider.set_size_request(0,200)
+    slider.set_range(0,100)
+    slider.set_inverted(True)
+    slider.set_draw_value(False)
+    slider.connect('value-changed', self.slider_changed)
+    slider.connect('button-press-event', self.slider_pressed)
+    slider.connect('button-release-event', self.slider_released)
+    box.add(slider)
+    button = Gtk.Button.new_with_label('M')
+    def button_clicked(button):
+      self.mixer.set_mute(not self.mixer.muted)
+      button.set_label('M' if self.mixer.muted else 'm')
+      self.gtk_update_ui(True)
+    button.connect('clicked', button_clicked)
+    box.add(button)
+    self.window = window
+    self.slider = slider
+    self.button = button
+
+  # Dragging the slider generates a flood of value-changed events, so write only the latest value,
+  # at most once per frame (or per `slider_write_interval`), and always write the final value when
+  # the slider is released
+  def write_slider(self, *args):
+    if self.slider_pending:
+      self.slider_pending = False
+      writes = self.mixer.writes
+      self.mixer.set_volume(self.slider.get_value())
+      self.slider_drag_writes += self.mixer.writes - writes
+      self.gtk_update_ui(True)
+    return GLib.SOURCE_REMOVE
+
+  def slider_changed(self, slider):
+    if not self.slider_pending:
+      self.slider_pending = True
+      if self.slider_write_interval is None:
+        slider.add_tick_callback(self.write_slider)
+      elif self.slider_write_interval == 0:
+        self.write_slider()
+      else:
+        GLib.timeout_add(int(self.slider_write_interval*1000), self.write_slider)
+
+  def slider_pressed(self, slider=None, event=None):
+    self.slider_drags += 1
+    self.slider_drag_start_writes = self.slider_drag_writes
+
+  def slider_released(self, slider=None, event=None):
+    self.write_slider()
+    self.slider_drag_writes_max = max(self.slider_drag_writes_max,
+     self.slider_drag_writes - self.slider_drag_start_writes)
+
+  def update_window(self):
+    if self.window_visible:
+      self.slider.set_value(self.mixer.volume)
+      self.button.set_label('M' if self.mixer.muted else 'm')
+
   # Update the UI (thread-safe)
-  def update_ui(self, window_changed=False):
-    GLib.idle_add(self.gtk_update_ui, window_changed)
+  def update_ui(self):
+    self.dispatcher.request()
 
   # Update the UI (within the GTK main thread ; not thread-safe)
   def gtk_update_ui(self, window_changed=False):
-    if self.alsa_ctl.getmute()[0] == 1:
-      self.tray_label.set_text(self.prefix+'M'+self.suffix)
-    else:
-      volume = self.alsa_ctl.getvolume()[0]
-      self.tray_label.set_text(self.prefix+str(volume)+self.suffix)
+    display_strs = []
+    for label, mixer in zip(self.mixer_labels, self.mixers):
+      display_strs.append(label+('M' if mixer.muted else str(mixer.volume)))
+    self.renderer.render(self.prefix+self.separator.join(display_strs)+self.suffix)
 
     if not window_changed:
       self.update_window()
@@ -199,36 +299,19 @@ class VolumeApp:
     # Return false to unregister this method as a GLib idle handler
     return False
 
-  def start_monitor_thread(self):
-    def run_in_thread(self=self):
-      alsa_poll = select.poll()
-      alsa_poll.register(*(self.alsa_ctl.polldescriptors()[0]))
-      while True:
-        # Wait for an event
-        # We don't get events when we make changes,
-        # only when other processes make changes
-        alsa_poll.poll()
-        self.alsa_ctl.handleevents()
-        self.update_ui()
-    thread = threading.Thread(target=run_in_thread)
-    thread.daemon = True
-    thread.start()
+  def start_monitor(self):
+    # Events are handled within the GTK main thread as soon as they arrive, without any thread or
+    # idle handler hops.  (See mixers.MixerMonitor)
+    def mixer_changed(mixer, self=self):
+      # The popup window only shows the first control
+      self.gtk_update_ui(mixer is not self.mixer)
+    def call_later(delay, callback, *args):
+      return GLib.timeout_add(int(delay*1000), callback, *args)
+    self.monitor = mixers.MixerMonitor(self.mixers, mixer_changed, tray_common.watch_fd,
+     GLib.source_remove, call_later)
+    tray_common.register_stats('VolumeApp.monitor', self.monitor.get_stats)
 
 if __name__ == '__main__':
   VolumeApp()
 
-  def on_sigint(_signum, _frame):
-    Gtk.main_quit()
-  signal.signal(signal.SIGINT, on_sigint)
-
-  # If the main thread is running C code (such as Gtk.main()), then Python signal handlers will not
-  # run until that C code returns.  To work around this, run the C code in a separate thread, then
-  # sleep the main thread.  Unfortunately, threading.Thread().join() and threading.Event().wait() in
-  # Python 2.X (but not 3.X) also block signal handlers (see http://bugs.python.org/issue1167930).
-  # To work around this, sleep the main thread using signal.pause(), and wake it from the 'Quit'
-  # menu item above using `os.kill(os.getpid(), signal.SIGINT)`.
-  thread = threading.Thread(target=Gtk.main)
-  thread.start()
-  if sys.version_info < (3, 0):
-    signal.pause()
-  thread.join()
+  tray_common.run()
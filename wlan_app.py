@@ -20,10 +20,9 @@
 #
 # Prerequisites:
 # Install GtkTrayIcon (from the gtktrayicon/ subdirectory)
+# Keep tray_common.py in the same directory as this script
 # sudo apt-get install --no-install-recommends libgirepository1.0-dev gobject-introspection \
-#  gir1.2-gtk-3.0 python3-twisted
-# This also installs txdbus
-# sudo apt-get install python-pip ; sudo pip install wpa_supplicant
+#  gir1.2-gtk-3.0 python3-pydbus
 #
 # sudo usermod -a -G netdev <user>
 # sudo vi /etc/dbus-1/system.d/wpa_supplicant.conf
@@ -50,35 +49,143 @@ background_color = '#9A9A9A'
 
 import gi
 gi.require_version('Gtkti', '3.0')
-from gi.repository import Gtkti, Gtk, Gdk, GLib
-import signal, sys, os
-import threading
-from pydbus import SystemBus
-from twisted.internet.selectreactor import SelectReactor
-# See https://w1.fi/wpa_supplicant/devel/dbus.html
-# and https://pypi.python.org/pypi/wpa_supplicant/
-from wpa_supplicant.core import BUS_NAME, WpaSupplicantDriver, WpaSupplicant, Interface
+from gi.repository import Gtkti, Gtk, Gdk, GLib, Gio
+import tray_common
+import sys
 import time
+import collections
+
+# See https://w1.fi/wpa_supplicant/devel/dbus.html
+# For troubleshooting purposes, `dbus-monitor --system sender=fi.w1.wpa_supplicant1` should show the
+# DBus Signals.
+WPAS_NAME = 'fi.w1.wpa_supplicant1'
+WPAS_PATH = '/fi/w1/wpa_supplicant1'
+WPAS_IFACE = 'fi.w1.wpa_supplicant1'
+WPAS_INTERFACE_IFACE = 'fi.w1.wpa_supplicant1.Interface'
+WPAS_BSS_IFACE = 'fi.w1.wpa_supplicant1.BSS'
+PROPERTIES_IFACE = 'org.freedesktop.DBus.Properties'
+
+# Interface properties that are used for rendering
+# (GetAll returns many more, including the list of all BSSs, which are not kept.)
+WLAN_PROPS = ('Ifname', 'State', 'CurrentBSS')
+
+# State of a wpa_supplicant interface, which is used for rendering
+# The state is filled in by a GetAll call when the interface is found, then kept up to date using
+# the values included in the interface's PropertiesChanged signals.  All calls to wpa_supplicant are
+# asynchronous, so rendering never blocks on wpa_supplicant (which can be slow to respond while it
+# is scanning).
+class WlanState:
+
+  def __init__(self, path, props, max_bsss, max_bss_age):
+    self.path = path
+    self.props = {}
+    self.bss_cache = BssCache(max_bsss, max_bss_age)
+    self.update(props)
+
+  def update(self, props):
+    for name in WLAN_PROPS:
+      if name in props:
+        self.props[name] = props[name]
+    # The current BSS is rendered on every update, so it must never be evicted from the cache
+    self.bss_cache.pinned = self.props.get('CurrentBSS')
+
+# BSS properties that are used for rendering
+# (GetAll and BSSAdded also return large Information Element blobs, which are not kept.)
+class Bss:
+  __slots__ = ('ssid', 'signal', 'frequency', 'last_seen')
+
+  def __init__(self):
+    self.ssid = ''
+    self.signal = None  # dBm
+    self.frequency = None  # MHz
+    self.last_seen = 0
+
+  def update(self, props):
+    if 'SSID' in props:
+      self.ssid = bytes(props['SSID']).decode('utf-8', 'replace')
+    if 'Signal' in props:
+      self.signal = props['Signal']
+    if 'Frequency' in props:
+      self.frequency = props['Frequency']
+    self.last_seen = time.monotonic()
 
-# Ignore log messages from wpa_supplicant.core
-# (It spits out some log messages for expected exceptions)
-import logging
-logger = logging.getLogger('wpasupplicant')
-logger.addHandler(logging.NullHandler())
-
-# Default WpaSupplicant.get_interfaces() returns D-Bus paths, which is useless since we have no way
-# to retrieve interfaces using those paths.  Monkey patch it to return Interface objects.
-def get_interface_for_path(self, interface_path):
-    interface = self._interfaces_cache.get(interface_path, None)
-    if interface is not None:
-        return interface
+  # Rough signal quality percentage, as displayed by most network managers
+  def quality(self):
+    return min(100, max(0, 2 * (self.signal + 100)))
+
+  def band(self):
+    if self.frequency < 3000:
+      return '2.4 GHz'
+    if self.frequency < 5925:
+      return '5 GHz'
+    if self.frequency < 7200:
+      return '6 GHz'
+    return '60 GHz'
+
+  def describe(self):
+    details = []
+    if self.signal is not None:
+      details.append(str(self.signal)+' dBm')
+    if self.frequency:
+      details.append(self.band())
+    return self.ssid+(' ('+', '.join(details)+')' if details else '')
+
+# Bounded cache of the BSSs (access points) seen by a wpa_supplicant interface, keyed by object path
+# wpa_supplicant reports BSSs individually as they appear and expire (BSSAdded/BSSRemoved) and as
+# their properties change, so the cache is never rebuilt after a scan.  If more than `max_size` BSSs
+# are reported, the least recently seen BSSs are evicted, so memory use stays flat regardless of the
+# number of BSSs in range.  BSSs that have not been seen for `max_age` seconds are also evicted, in
+# case wpa_supplicant stops reporting them without sending BSSRemoved.  The `pinned` BSS (the
+# interface's current BSS) is never evicted.
+class BssCache:
+
+  def __init__(self, max_size, max_age):
+    self.max_size = max_size
+    self.max_age = max_age
+    self.entries = collections.OrderedDict()  # Least recently seen first
+    self.pinned = None
+    self.evictions = 0
+    self.expirations = 0
+
+  def get(self, path):
+    return self.entries.get(path)
+
+  def update(self, path, props):
+    bss = self.entries.get(path)
+    if bss:
+      self.entries.move_to_end(path)
     else:
-        interface = Interface(interface_path, self._conn, self._reactor)
-        self._interfaces_cache[interface_path] = interface
-        return interface
-def get_interfaces(self):
-    return map(lambda p: get_interface_for_path(self, p), self.get('Interfaces'))
-WpaSupplicant.get_interfaces = get_interfaces
+      bss = self.entries[path] = Bss()
+      if len(self.entries) > self.max_size:
+        self.evict_oldest()
+    bss.update(props)
+    self.expire(bss.last_seen)
+    return bss
+
+  def evict_oldest(self):
+    for path in self.entries:
+      if path != self.pinned:
+        del self.entries[path]
+        self.evictions += 1
+        return
+
+  def expire(self, now):
+    stale = []
+    for path, bss in self.entries.items():
+      if now - bss.last_seen < self.max_age:
+        break
+      if path != self.pinned:
+        stale.append(path)
+    for path in stale:
+      del self.entries[path]
+    self.expirations += len(stale)
+
+  def remove(self, path):
+    return self.entries.pop(path, None)
+
+  def values(self):
+    self.expire(time.monotonic())
+    return self.entries.values()
 
 # WARNING: Variable scope for Python inline functions and lambdas does not work like other
 # languages!  To ensure that definition-scope variables are passed into the function/lambda's scope
@@ -87,54 +194,91 @@ WpaSupplicant.get_interfaces = get_interfaces
 
 class WlanApp:
 
-  def __init__(self):
+  # `dbus` may be an existing pydbus SystemBus() connection (by default, the connection returned
+  # by tray_common.get_system_bus() is used)
+  def __init__(self, dbus=None):
     self.prefix = 'W:'
     self.suffix = ' '
     self.tooltip_heading = 'Wireless LAN Status:\n'
 
     self.iface = None  # Set to interface name to override interface selection
+    self.show_signal = False  # Show the signal quality of the current BSS
+    self.nearby_networks = 10  # Number of nearby networks to list in the tooltip
+    self.max_bsss = 256  # Maximum number of BSSs to cache
+    self.max_bss_age = 300  # seconds ; Evict cached BSSs that have not been seen for this long
 
-    self.build_ui()
+    # wpa_supplicant sends a burst of state changes while connecting or roaming.  Wait for them to
+    # settle (up to the max latency) before updating the UI.  (See tray_common.UpdateDispatcher)
+    self.update_min_interval = 0.1  # seconds
+    self.update_max_latency = 0.5  # seconds
+    self.dispatcher = tray_common.UpdateDispatcher('WlanApp', self.gtk_update_ui,
+     self.update_min_interval, self.update_max_latency)
 
-    # Needed by wpa_supplicant.core
-    self.reactor = SelectReactor()
-    thread = threading.Thread(target=self.reactor.run, kwargs={'installSignalHandlers': 0})
-    thread.daemon = True
-    thread.start()
-    time.sleep(0.1)  # let reactor start
+    self.build_ui()
 
-    self.wpasup = None
     self.wpasup_running = False
-    self.wlan = None
-    self.wlan_signal = None
+    self.wpa_interfaces = {}  # WlanState objects, keyed by object path
+    self.wlan = None  # Selected WlanState
 
+    # For troubleshooting and performance monitoring (See tray_common.register_stats)
+    self.dbus_calls = 0
+    self.dbus_signals = 0
+    self.dbus_subscriptions = []
+    tray_common.register_stats('WlanApp.dbus', lambda self=self: {
+      'calls': self.dbus_calls,
+      'signals': self.dbus_signals,
+      'subscriptions': len(self.dbus_subscriptions),
+      'interfaces': len(self.wpa_interfaces),
+      'bss_cached': sum(len(i.bss_cache.entries) for i in self.wpa_interfaces.values()),
+      'bss_evictions': sum(i.bss_cache.evictions for i in self.wpa_interfaces.values()),
+      'bss_expirations': sum(i.bss_cache.expirations for i in self.wpa_interfaces.values()),
+    })
+
+    self.dbus = dbus
+    tray_common.mark_startup('WlanApp', 'ui_built')
+    # Connecting to the system bus can be slow at login, so show the placeholder label first
+    self.renderer.after_first_paint(self.connect_wpa_supplicant)
+
+  def connect_wpa_supplicant(self):
+    if not self.dbus:
+      self.dbus = tray_common.get_system_bus()
+    # These signals are only sent while wpa_supplicant is running, so it is safe to subscribe to them
+    # before wpa_supplicant starts, and the subscriptions never need to be renewed.
+    self.dbus_subscriptions += [
+      self.dbus.subscribe(sender=WPAS_NAME, iface=WPAS_IFACE, signal='InterfaceAdded',
+       signal_fired=lambda sender, path, iface, signal, params: self.interface_added(*params)),
+      self.dbus.subscribe(sender=WPAS_NAME, iface=WPAS_IFACE, signal='InterfaceRemoved',
+       signal_fired=lambda sender, path, iface, signal, params: self.interface_removed(*params)),
+      self.dbus.subscribe(sender=WPAS_NAME, iface=WPAS_INTERFACE_IFACE, signal='BSSAdded',
+       signal_fired=lambda sender, path, iface, signal, params: self.bss_added(path, *params)),
+      self.dbus.subscribe(sender=WPAS_NAME, iface=WPAS_INTERFACE_IFACE, signal='BSSRemoved',
+       signal_fired=lambda sender, path, iface, signal, params: self.bss_removed(path, *params)),
+      self.dbus.subscribe(sender=WPAS_NAME, iface=PROPERTIES_IFACE, signal='PropertiesChanged',
+       signal_fired=lambda sender, path, iface, signal, params: self.properties_changed(path, *params)),
+    ]
     # Monitor the availability of wpa_supplicant via DBus
-    self.dbus = SystemBus()
-    # watch_name() fires an event as soon as GLib.MainLoop() starts, so we don't need to explicitly
+    # watch_name() fires an event as soon as the main loop starts, so we don't need to explicitly
     # call get_wpa_supplicant() here
-    self.dbus.watch_name(BUS_NAME, 0, self.get_wpa_supplicant, self.get_wpa_supplicant)
-    self.start_watch_thread()
+    self.dbus_subscriptions.append(
+     self.dbus.watch_name(WPAS_NAME, 0, self.get_wpa_supplicant, self.get_wpa_supplicant))
+    tray_common.mark_startup('WlanApp', 'backend_connected')
 
   def build_ui(self):
     self.tray = tray = Gtkti.TrayIcon()
     self.eventbox = eventbox = Gtk.EventBox()
     if background_color:
-      css = Gtk.CssProvider()
-      css.load_from_data(('* { background-color: '+background_color+'; }').encode())
-      Gtk.StyleContext.add_provider_for_screen(Gdk.Screen.get_default(), css, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION)
+      tray_common.set_background_color(background_color)
     eventbox.set_tooltip_text(self.tooltip_heading+'WPA Supplicant not running')
     tray.add(eventbox)
     self.tray_label = tray_label = Gtk.Label(label=self.prefix+'_'+self.suffix)
     eventbox.add(tray_label)
     tray.show_all()
+    self.renderer = tray_common.Renderer('WlanApp', tray_label, eventbox)
 
     menu = Gtk.Menu()
     item_quit = Gtk.MenuItem(label='Quit')
     def quit(menu_item):
-      if sys.version_info < (3, 0):
-        os.kill(os.getpid(), signal.SIGINT)
-      else:
-        Gtk.main_quit()
+      Gtk.main_quit()
     item_quit.connect('activate', quit)
     menu.append(item_quit)
     menu.show_all()
@@ -145,7 +289,7 @@ class WlanApp:
 
   # Update the UI (thread-safe)
   def update_ui(self):
-    GLib.idle_add(self.gtk_update_ui)
+    self.dispatcher.request()
 
   # Update the UI (within the GTK main thread ; not thread-safe)
   def gtk_update_ui(self):
@@ -156,112 +300,162 @@ class WlanApp:
       display_str = '_'
       tooltip_str = 'WLAN Interface not found via WPA Supplicant'
     else:
-      try:
-        ifname = self.wlan.get_ifname()
-        tooltip_str = ifname
-        state = self.wlan.get_state()
-        tooltip_str += ' '+state.title()
-        if state == 'interface_disabled':
-          display_str = '_'
-        elif state == 'disconnected' or state == 'inactive':
-          display_str = '-'
-        elif state == 'scanning':
-          display_str = '?'
-        elif state == 'authenticating' or state == 'associating' or state == 'associated' or \
-             state == '4way_handshake' or state == 'group_handshake':
-          display_str = '@'
-        elif state == 'completed':
-          display_str = ''
-          tooltip_str += ' Connected'
-        elif state == 'unknown':
-          display_str = '!'
-        else:
-          display_str = '!'
-          print >> sys.stderr, 'Unknown wpa_supplicant state: '+state+' to '+self.wlan.get_current_bss().get_ssid()
-        bss = self.wlan.get_current_bss()
-        if bss:
-          display_str += bss.get_ssid()
-          tooltip_str += ' to '+bss.get_ssid()
-      except:
-        # This is expected if another thread sets self.wlan to None while the above code is
-        # executing, or if wpa_supplicant shuts down while the above code is executing.  In either
-        # case, another UI update should happen momentarily.
+      ifname = self.wlan.props.get('Ifname', '')
+      state = self.wlan.props.get('State', 'unknown')
+      bss = self.wlan.bss_cache.get(self.wlan.props.get('CurrentBSS'))
+      tooltip_str = ifname+' '+state.title()
+      if state == 'interface_disabled':
+        display_str = '_'
+      elif state == 'disconnected' or state == 'inactive':
+        display_str = '-'
+      elif state == 'scanning':
+        display_str = '?'
+      elif state == 'authenticating' or state == 'associating' or state == 'associated' or \
+           state == '4way_handshake' or state == 'group_handshake':
+        display_str = '@'
+      elif state == 'completed':
+        display_str = ''
+        tooltip_str += ' Connected'
+      elif state == 'unknown':
+        display_str = '!'
+      else:
         display_str = '!'
-        tooltip_str = 'Unknown (Exception Thrown)'
-    self.tray_label.set_text(self.prefix+display_str+self.suffix)
-    self.eventbox.set_tooltip_text(self.tooltip_heading+tooltip_str)
+        print('Unknown wpa_supplicant state: '+state, file=sys.stderr)
+      if bss and bss.ssid:
+        display_str += bss.ssid
+        if self.show_signal and bss.signal is not None:
+          display_str += ' '+str(bss.quality())+'%'
+        tooltip_str += ' to '+bss.describe()
+      if self.nearby_networks:
+        # Strongest BSS for each SSID
+        networks = {}
+        for nearby in self.wlan.bss_cache.values():
+          if nearby.ssid and nearby.signal is not None and \
+             (nearby.ssid not in networks or nearby.signal > networks[nearby.ssid].signal):
+            networks[nearby.ssid] = nearby
+        if networks:
+          networks = sorted(networks.values(), key=lambda b: b.signal, reverse=True)
+          tooltip_str += '\nNearby Networks:'
+          for nearby in networks[:self.nearby_networks]:
+            tooltip_str += '\n  '+nearby.describe()
+    self.renderer.render(self.prefix+display_str+self.suffix, self.tooltip_heading+tooltip_str)
 
     # Return false to unregister this method as a GLib idle handler
     return False
 
-  def select_wlan_interface(self, interfaces):
-    if self.wlan_signal:
-      wlan_signal = self.wlan_signal  # To avoid race conditions
-      self.wlan_signal = None
-      wlan_signal.cancel()
+  # Asynchronously call a wpa_supplicant method, then call `callback(*return_values)`
+  # Errors are expected if wpa_supplicant shuts down while a call is in progress.  In that case, the
+  # callback is not called, and another update should happen momentarily.
+  def call_async(self, path, iface, method, args, reply_type, callback):
+    def call_done(con, result, callback=callback):
+      try:
+        reply = con.call_finish(result).unpack()
+      except GLib.Error as e:
+        print('Error from WPA Supplicant: '+e.message, file=sys.stderr)
+        return
+      callback(*reply)
+    self.dbus.con.call(WPAS_NAME, path, iface, method, args, GLib.VariantType.new(reply_type),
+     Gio.DBusCallFlags.NONE, -1, None, call_done)
+    self.dbus_calls += 1
+
+  def get_all_async(self, path, iface, callback):
+    self.call_async(path, PROPERTIES_IFACE, 'GetAll', GLib.Variant('(s)', (iface,)), '(a{sv})',
+     callback)
+
+  def get_wpa_supplicant(self, dbus_name_owner = None):
+    self.wpa_interfaces = {}
     self.wlan = None
-    if interfaces:
-      if self.iface:
-        for interface in interfaces:
-          if interface.get_ifname() == self.iface:
-            self.wlan = interface
-            break
-      else:
-        self.wlan = interfaces[0]
-      self.wlan_signal = \
-       self.wlan.register_signal('PropertiesChanged', lambda args: self.update_ui())
+    self.wpasup_running = bool(dbus_name_owner)
+    if self.wpasup_running:
+      # wpa_supplicant doesn't send InterfaceAdded signals for interfaces that exist when it starts,
+      # so they must be fetched explicitly
+      def got_wpasup(props, self=self):
+        for path in props.get('Interfaces', []):
+          self.get_all_async(path, WPAS_INTERFACE_IFACE,
+           lambda props, self=self, path=path: self.add_interface(path, props))
+      self.get_all_async(WPAS_PATH, WPAS_IFACE, got_wpasup)
     self.update_ui()
 
-  def scan_wpa_interfaces(self, args=None):
-    self.wpa_interfaces = self.wpasup.get_interfaces()
-    self.select_wlan_interface(self.wpa_interfaces)
+  def interface_added(self, path, props):
+    self.dbus_signals += 1
+    self.add_interface(path, props)
 
-  def wlan_interface_removed(self, path):
-    # wpa_supplicant sends InterfaceRemoved just before shutting down, and get_interfaces() may
-    # throw an exception if it is called while wpa_supplicant is shutting down.  So, instead of
-    # calling scan_wpa_interfaces on InterfaceRemoved, it is probably better to keep a cache of the
-    # list of interfaces and just delete the relevant interface from the cache.
-    self.wpa_interfaces[:] = [i for i in self.wpa_interfaces if not i.get_path() == path]
-    self.select_wlan_interface(self.wpa_interfaces)
+  def add_interface(self, path, props):
+    if not self.wpasup_running or path in self.wpa_interfaces:
+      return
+    self.wpa_interfaces[path] = interface = WlanState(path, props, self.max_bsss, self.max_bss_age)
+    # After this, BSSs are tracked using BSSAdded and BSSRemoved
+    bsss = props.get('BSSs', [])[:self.max_bsss]
+    current_bss = interface.props.get('CurrentBSS', '/')
+    if current_bss != '/' and current_bss not in bsss:
+      bsss.append(current_bss)
+    for bss in bsss:
+      self.fetch_bss(interface, bss)
+    self.select_wlan_interface()
 
-  def get_wpa_supplicant(self, dbus_name_owner = None):
-    if dbus_name_owner:
-      self.wpasup_running = True
-      if not self.wpasup:
-        # Connect to wpa_supplicant
-        self.wpasup = WpaSupplicantDriver(self.reactor).connect()
-        self.wpasup.register_signal('InterfaceAdded', self.scan_wpa_interfaces)
-        self.wpasup.register_signal('InterfaceRemoved', self.wlan_interface_removed)
-        self.scan_wpa_interfaces()
-      else:
-        # If we don't do anything when wpa_supplicant vanishes, then our signals seem to remain
-        # registered when wpa_supplicant re-appears.  However, wpa_supplicant doesn't seem to send
-        # InterfaceAdded signals when it comes up, so we must explicitly re-scan the interfaces.
-        self.scan_wpa_interfaces()
-    else:
-      self.wpasup_running = False
-      self.select_wlan_interface([])
+  def interface_removed(self, path):
+    self.dbus_signals += 1
+    if self.wpa_interfaces.pop(path, None):
+      self.select_wlan_interface()
+
+  def select_wlan_interface(self):
+    wlan = None
+    for interface in self.wpa_interfaces.values():
+      if not self.iface or interface.props.get('Ifname') == self.iface:
+        wlan = interface
+        break
+    self.wlan = wlan
+    self.update_ui()
+
+  def fetch_bss(self, interface, path):
+    def got_bss(props, self=self, interface=interface, path=path):
+      if self.wpa_interfaces.get(interface.path) is interface:
+        interface.bss_cache.update(path, props)
+        if interface is self.wlan:
+          self.update_ui()
+    self.get_all_async(path, WPAS_BSS_IFACE, got_bss)
+
+  def bss_added(self, interface_path, path, props):
+    self.dbus_signals += 1
+    interface = self.wpa_interfaces.get(interface_path)
+    if interface:
+      interface.bss_cache.update(path, props)
+      if interface is self.wlan and self.nearby_networks:
+        self.update_ui()
+
+  def bss_removed(self, interface_path, path):
+    self.dbus_signals += 1
+    interface = self.wpa_interfaces.get(interface_path)
+    if interface and interface.bss_cache.remove(path):
+      if interface is self.wlan and self.nearby_networks:
+        self.update_ui()
 
-  def start_watch_thread(self):
-    thread = threading.Thread(target=GLib.MainLoop().run)
-    thread.daemon = True
-    thread.start()
+  def properties_changed(self, path, iface, changed, invalidated):
+    self.dbus_signals += 1
+    if iface == WPAS_BSS_IFACE:
+      interface = self.wpa_interfaces.get(path.rpartition('/BSSs/')[0])
+      # Ignore BSSs that have been evicted from the cache
+      if interface and interface.bss_cache.get(path):
+        interface.bss_cache.update(path, changed)
+        if interface is self.wlan and \
+           (self.nearby_networks or path == interface.props.get('CurrentBSS')):
+          self.update_ui()
+      return
+    if iface != WPAS_INTERFACE_IFACE:
+      return
+    interface = self.wpa_interfaces.get(path)
+    if not interface:
+      return
+    interface.update(changed)
+    bss = interface.props.get('CurrentBSS', '/')
+    if 'CurrentBSS' in changed and bss != '/' and not interface.bss_cache.get(bss):
+      self.fetch_bss(interface, bss)
+    if interface is self.wlan:
+      self.update_ui()
+    elif self.iface and 'Ifname' in changed:
+      self.select_wlan_interface()
 
 if __name__ == '__main__':
   WlanApp()
 
-  def on_sigint(_signum, _frame):
-    Gtk.main_quit()
-  signal.signal(signal.SIGINT, on_sigint)
-
-  # If the main thread is running C code (such as Gtk.main()), then Python signal handlers will not
-  # run until that C code returns.  To work around this, run the C code in a separate thread, then
-  # sleep the main thread.  Unfortunately, threading.Thread().join() and threading.Event().wait() in
-  # Python 2.X (but not 3.X) also block signal handlers (see http://bugs.python.org/issue1167930).
-  # To work around this, sleep the main thread using signal.pause(), and wake it from the 'Quit'
-  # menu item above using `os.kill(os.getpid(), signal.SIGINT)`.
-  thread = threading.Thread(target=Gtk.main)
-  thread.start()
-  if sys.version_info < (3, 0):
-    signal.pause()
-  thread.join()
+  tray_common.run()